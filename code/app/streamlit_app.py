@@ -1,14 +1,23 @@
 import json
 import math
+import operator
 import os
 import pickle
+import re
 import sys
+from dataclasses import dataclass
 from pathlib import Path
 from typing import Dict, List, Optional, Tuple
 
+import numpy as np
 import pandas as pd
 import streamlit as st  # type: ignore[import]
 
+try:
+    import orjson  # type: ignore[import]
+except ImportError:  # dependência opcional: cai para o `json` da stdlib
+    orjson = None
+
 APP_DIR = Path(__file__).resolve().parent
 PROJECT_ROOT = APP_DIR.parent
 SRC_PATH = PROJECT_ROOT / "src"
@@ -18,8 +27,7 @@ if str(SRC_PATH) not in sys.path:
     sys.path.insert(0, str(SRC_PATH))
 
 from src.constants import PENALTY
-from src.loader import PROJECT_ROOT as PROJECT_ROOT_CONST
-from src.main import GRAPH_CACHE_FILE, PARETO_DIR, run_example
+from src.loader import GRAPH_CACHE_FILE, PARETO_DIR, PROJECT_ROOT as PROJECT_ROOT_CONST
 
 PROJECT_ROOT = PROJECT_ROOT_CONST
 
@@ -32,49 +40,75 @@ PRESET_WEIGHTS: Dict[str, Tuple[float, float, float]] = {
 }
 
 
-def _load_pareto_solutions() -> List[dict]:
-    if not PARETO_FILE.exists():
-        return []
+# Leituras em cache do Streamlit, chaveadas por (caminho, mtime, tamanho): só
+# voltam a ler o disco quando o ficheiro muda (p.ex. depois de `run_example`).
+def _file_cache_key(path) -> Optional[Tuple[str, int, int]]:
+    try:
+        st_info = os.stat(path)
+    except OSError:
+        return None
+    return str(path), st_info.st_mtime_ns, st_info.st_size
+
+
+@st.cache_data(show_spinner=False, max_entries=1)
+def _read_pareto_file(path: str, mtime_ns: int, size: int) -> List[dict]:
     try:
-        with open(PARETO_FILE, "r", encoding="utf-8") as fh:
-            data = json.load(fh)
-        if isinstance(data, list):
-            return data
+        raw = Path(path).read_bytes()
+        data = orjson.loads(raw) if orjson is not None else json.loads(raw)
     except (OSError, json.JSONDecodeError):
         return []
-    return []
+    return data if isinstance(data, list) else []
+
+
+def _load_pareto_solutions() -> List[dict]:
+    key = _file_cache_key(PARETO_FILE)
+    if key is None:
+        return []
+    return _read_pareto_file(*key)
+
+
+# ID de paragem: sem espaços e com pelo menos um dígito (ex.: 803, CRG2).
+_STOP_ID_RE = re.compile(r"[^ ]*\d[^ ]*")
 
 
 def _classify_stop_input(value: str) -> Tuple[Optional[str], Optional[str]]:
     if not value:
         return None, None
     value = value.strip()
-    if "," in value:
-        return value, None
-    if any(ch.isdigit() for ch in value) and " " not in value:
+    if "," in value or _STOP_ID_RE.fullmatch(value):
         return value, None
     return None, value
 
 
+@st.cache_resource(show_spinner=False, max_entries=1)
+def _read_graph_file(path: str, mtime_ns: int, size: int):
+    try:
+        with open(path, "rb") as fh:
+            return pickle.load(fh)
+    except (OSError, pickle.UnpicklingError):
+        return None
+
+
+def _load_graph_cache():
+    key = _file_cache_key(GRAPH_CACHE_FILE)
+    if key is None:
+        return None
+    return _read_graph_file(*key)
+
+
 def _ensure_graph_cache(reset: bool = False):
     if reset and "graph_cache" in st.session_state:
         st.session_state.pop("graph_cache", None)
     if "graph_cache" not in st.session_state:
-        if os.path.exists(GRAPH_CACHE_FILE):
-            try:
-                with open(GRAPH_CACHE_FILE, "rb") as fh:
-                    st.session_state["graph_cache"] = pickle.load(fh)
-            except (OSError, pickle.UnpicklingError):
-                st.session_state["graph_cache"] = None
-        else:
-            st.session_state["graph_cache"] = None
+        st.session_state["graph_cache"] = _load_graph_cache()
     return st.session_state.get("graph_cache")
 
 
-def _node_label(node_id: Optional[str]) -> str:
+def _node_label(node_id: Optional[str], graph=None) -> str:
     if not node_id:
         return "?"
-    graph = _ensure_graph_cache()
+    if graph is None:
+        graph = _ensure_graph_cache()
     if graph and hasattr(graph, "G") and node_id in graph.G:
         data = graph.G.nodes[node_id]
         stop_name = data.get("stop_name")
@@ -85,6 +119,46 @@ def _node_label(node_id: Optional[str]) -> str:
     return node_id
 
 
+_METRIC_KEYS = ("time_total_s", "emissions_g", "walk_m", "waiting_time_s", "n_transfers")
+_METRIC_DEFAULTS = (PENALTY, PENALTY, 0.0, 0.0, 0)
+_METRIC_GETTER = operator.itemgetter(*_METRIC_KEYS)
+
+
+def _metric_row(metrics: dict) -> tuple:
+    try:
+        return _METRIC_GETTER(metrics)
+    except KeyError:
+        return tuple(metrics.get(key, default) for key, default in zip(_METRIC_KEYS, _METRIC_DEFAULTS))
+
+
+@dataclass(frozen=True)
+class MetricsView:
+    """Métricas das soluções em colunas NumPy (uma passagem sobre `solutions`)."""
+
+    time_s: np.ndarray
+    emissions_g: np.ndarray
+    walk_m: np.ndarray
+    wait_s: np.ndarray
+    n_transfers: np.ndarray
+
+    @classmethod
+    def from_solutions(cls, solutions: List[dict]) -> "MetricsView":
+        rows = np.array(
+            [_metric_row(sol.get("metrics") or {}) for sol in solutions],
+            dtype=np.float64,
+        ).reshape(len(solutions), len(_METRIC_KEYS))
+        return cls(
+            time_s=rows[:, 0],
+            emissions_g=rows[:, 1],
+            walk_m=rows[:, 2],
+            wait_s=rows[:, 3],
+            n_transfers=rows[:, 4].astype(np.int64),
+        )
+
+    def __len__(self) -> int:
+        return len(self.time_s)
+
+
 def _format_minutes(seconds: Optional[float]) -> str:
     if seconds in (None, PENALTY):
         return "-"
@@ -92,60 +166,44 @@ def _format_minutes(seconds: Optional[float]) -> str:
     return f"{minutes:.1f}"
 
 
-def _normalize(values: List[float]) -> List[float]:
-    if not values:
-        return []
-    min_v = min(values)
-    max_v = max(values)
-    if math.isclose(min_v, max_v):
-        return [0.0 for _ in values]
-    span = max_v - min_v
-    return [(v - min_v) / span for v in values]
-
-
 def _auto_select_route(
-    solutions: List[dict],
+    view: MetricsView,
     preference: str,
     weights: Tuple[float, float, float],
 ) -> Optional[int]:
-    if not solutions:
+    if not len(view):
         return None
-    times = [sol["metrics"].get("time_total_s", PENALTY) for sol in solutions]
-    co2 = [sol["metrics"].get("emissions_g", PENALTY) for sol in solutions]
-    walks = [sol["metrics"].get("walk_m", 0.0) for sol in solutions]
-
     if preference == "Tempo":
-        return min(range(len(times)), key=lambda i: times[i])
+        return int(view.time_s.argmin())
     if preference == "CO₂":
-        return min(range(len(co2)), key=lambda i: co2[i])
+        return int(view.emissions_g.argmin())
     if preference == "Exercício":
-        return max(range(len(walks)), key=lambda i: walks[i])
-
-    norm_time = _normalize(times)
-    norm_co2 = _normalize(co2)
-    if walks and not math.isclose(max(walks), min(walks)):
-        walk_cost = [1.0 - val for val in _normalize(walks)]
-    else:
-        walk_cost = [0.0 for _ in walks]
+        return int(view.walk_m.argmax())
+
+    # Matriz (n_soluções x [tempo, CO₂, caminhada]) para normalizar por coluna.
+    metrics_arr = np.column_stack((view.time_s, view.emissions_g, view.walk_m))
+    mn = metrics_arr.min(axis=0)
+    mx = metrics_arr.max(axis=0)
+    constant = np.isclose(mx, mn, rtol=1e-9, atol=0.0)
+    span = np.where(constant, 1.0, mx - mn)
+    norm = (metrics_arr - mn) / span
+    norm[:, 2] = 1.0 - norm[:, 2]
+    # Colunas constantes não discriminam rotas → custo nulo.
+    norm[:, constant] = 0.0
 
     w_time, w_co2, w_walk = weights
     if math.isclose(w_time + w_co2 + w_walk, 0.0):
         w_time = 1.0
-    scores = []
-    for idx in range(len(solutions)):
-        score = (
-            w_time * norm_time[idx]
-            + w_co2 * norm_co2[idx]
-            + w_walk * walk_cost[idx]
-        )
-        scores.append(score)
-    return min(range(len(scores)), key=lambda i: scores[i])
+    scores = norm @ np.array([w_time, w_co2, w_walk], dtype=np.float64)
+    return int(scores.argmin())
 
 
-def _segment_description(seg: dict) -> str:
+def _segment_description(seg: dict, graph=None) -> str:
+    if graph is None:
+        graph = _ensure_graph_cache()
     mode = seg.get("mode")
-    start = _node_label(seg.get("from_stop"))
-    end = _node_label(seg.get("to_stop"))
+    start = _node_label(seg.get("from_stop"), graph)
+    end = _node_label(seg.get("to_stop"), graph)
     time_min = _format_minutes(seg.get("time_s"))
     distance_m = seg.get("distance_m", 0.0) or 0.0
     route = seg.get("route_id")
@@ -163,21 +221,17 @@ def _segment_description(seg: dict) -> str:
     return f"{label}: {start} → {end} ({time_min} min)"
 
 
-def _metrics_to_dataframe(solutions: List[dict]) -> pd.DataFrame:
-    rows = []
-    for idx, sol in enumerate(solutions):
-        metrics = sol.get("metrics", {})
-        rows.append(
-            {
-                "Rota": idx + 1,
-                "Tempo total (min)": float(metrics.get("time_total_s", 0.0)) / 60.0,
-                "CO₂ (g)": metrics.get("emissions_g", 0.0),
-                "Caminhada (m)": metrics.get("walk_m", 0.0),
-                "Esperas (min)": float(metrics.get("waiting_time_s", 0.0)) / 60.0,
-                "Transbordos": metrics.get("n_transfers", 0),
-            }
-        )
-    return pd.DataFrame(rows)
+def _metrics_to_dataframe(view: MetricsView) -> pd.DataFrame:
+    return pd.DataFrame(
+        {
+            "Rota": np.arange(1, len(view) + 1),
+            "Tempo total (min)": view.time_s / 60.0,
+            "CO₂ (g)": view.emissions_g,
+            "Caminhada (m)": view.walk_m,
+            "Esperas (min)": view.wait_s / 60.0,
+            "Transbordos": view.n_transfers,
+        }
+    )
 
 
 def _prepare_run_args(origin_input: str, dest_input: str) -> Dict[str, str]:
@@ -214,8 +268,9 @@ def _render_selected_route(solution: dict, idx: int):
     if not segments:
         st.write("Sem segmentos detalhados disponíveis.")
         return
+    graph = _ensure_graph_cache()
     for i, seg in enumerate(segments, start=1):
-        st.write(f"{i}. {_segment_description(seg)}")
+        st.write(f"{i}. {_segment_description(seg, graph)}")
 
 
 def main():
@@ -238,16 +293,18 @@ def main():
     )
     preset = PRESET_WEIGHTS[preference]
 
-    if "weight_time_slider" not in st.session_state:
-        st.session_state["weight_time_slider"] = float(preset[0])
-        st.session_state["weight_co2_slider"] = float(preset[1])
-        st.session_state["weight_walk_slider"] = float(preset[2])
-        st.session_state["last_preference"] = preference
-    elif st.session_state.get("last_preference") != preference:
-        st.session_state["weight_time_slider"] = float(preset[0])
-        st.session_state["weight_co2_slider"] = float(preset[1])
-        st.session_state["weight_walk_slider"] = float(preset[2])
-        st.session_state["last_preference"] = preference
+    if (
+        "weight_time_slider" not in st.session_state
+        or st.session_state.get("last_preference") != preference
+    ):
+        st.session_state.update(
+            {
+                "weight_time_slider": float(preset[0]),
+                "weight_co2_slider": float(preset[1]),
+                "weight_walk_slider": float(preset[2]),
+                "last_preference": preference,
+            }
+        )
 
     w_col1, w_col2, w_col3 = st.columns(3)
     w_time = w_col1.slider(
@@ -336,6 +393,10 @@ def main():
         except ValueError as exc:
             st.error(str(exc))
         else:
+            # Import diferido: `src.main` arrasta networkx/DEAP/graph_builder, que só
+            # são necessários quando se geram rotas (não no primeiro render).
+            from src.main import run_example
+
             with st.spinner("A calcular rotas ótimas (NSGA-II)..."):
                 try:
                     run_example(
@@ -355,33 +416,50 @@ def main():
                     if not solutions:
                         st.warning("Nenhuma solução válida encontrada.")
                     else:
-                        st.session_state["solutions"] = solutions
-                        st.session_state["weights"] = (w_time, w_co2, w_walk)
-                        st.session_state["preference"] = preference
-                        st.session_state["selected_idx"] = None
+                        # Tudo o que deriva das soluções é calculado uma vez aqui,
+                        # não em cada rerun provocado pelos sliders.
+                        view = MetricsView.from_solutions(solutions)
+                        st.session_state.update(
+                            {
+                                "solutions": solutions,
+                                "solutions_view": view,
+                                "solutions_df": _metrics_to_dataframe(view),
+                                "weights": (w_time, w_co2, w_walk),
+                                "preference": preference,
+                                "selected_idx": None,
+                            }
+                        )
 
     solutions = st.session_state.get("solutions")
     if not solutions:
         st.info("Ainda não há rotas para mostrar. Introduz origem/destino e gera primeiras soluções.")
         return
 
-    weights = st.session_state.get("weights", (1 / 3, 1 / 3, 1 / 3))
-    preference = st.session_state.get("preference", "Equilíbrio")
-    auto_idx = _auto_select_route(solutions, preference, weights)
+    view = st.session_state.get("solutions_view")
+    df = st.session_state.get("solutions_df")
+    if view is None or df is None or len(view) != len(solutions):
+        view = MetricsView.from_solutions(solutions)
+        df = _metrics_to_dataframe(view)
+        st.session_state.update({"solutions_view": view, "solutions_df": df})
+
+    # A escolha automática só é calculada quando ainda não há rota selecionada
+    # (i.e. logo após gerar soluções), não em cada rerun.
     if st.session_state.get("selected_idx") is None:
-        st.session_state["selected_idx"] = auto_idx
+        weights = st.session_state.get("weights", (1 / 3, 1 / 3, 1 / 3))
+        preference = st.session_state.get("preference", "Equilíbrio")
+        st.session_state["selected_idx"] = _auto_select_route(view, preference, weights)
 
-    df = _metrics_to_dataframe(solutions)
     st.markdown("### Pareto: compara opções")
+    # Formatação feita pelo frontend (column_config), sem reconstruir um Styler
+    # (e copiar o DataFrame) em cada rerun.
     st.dataframe(
-        df.style.format(
-            {
-                "Tempo total (min)": "{:.1f}",
-                "CO₂ (g)": "{:.0f}",
-                "Caminhada (m)": "{:.0f}",
-                "Esperas (min)": "{:.1f}",
-            }
-        ),
+        df,
+        column_config={
+            "Tempo total (min)": st.column_config.NumberColumn(format="%.1f"),
+            "CO₂ (g)": st.column_config.NumberColumn(format="%.0f"),
+            "Caminhada (m)": st.column_config.NumberColumn(format="%.0f"),
+            "Esperas (min)": st.column_config.NumberColumn(format="%.1f"),
+        },
         use_container_width=True,
     )
 
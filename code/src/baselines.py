@@ -1,10 +1,13 @@
 from __future__ import annotations
 
+from concurrent.futures import ProcessPoolExecutor
 from dataclasses import dataclass
-from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+from typing import Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+import numpy as np
 
 from constants import EMISSION_METRO_G_PER_KM, EMISSION_STCP_G_PER_KM, PENALTY
-from evolution import EMISSION_NORM_FACTOR, TIME_NORM_FACTOR
+from evolution import EMISSION_NORM_FACTOR, TIME_NORM_FACTOR, lambda_weight, normalized_edge_terms
 
 
 DEFAULT_LAMBDAS: Tuple[float, ...] = tuple(i / 20.0 for i in range(21))
@@ -23,65 +26,233 @@ class BaselineSolution:
     has_walk: bool = False
 
 
-def _edge_emissions(edge_data: dict) -> float:
-    distance_m = float(edge_data.get("distance_m", 0.0))
-    mode = edge_data.get("mode")
-    if mode == "stcp":
-        factor = EMISSION_STCP_G_PER_KM
-    elif mode == "metro":
-        factor = EMISSION_METRO_G_PER_KM
-    else:
-        factor = 0.0
-    return (distance_m / 1000.0) * factor
+def _safe_float(value) -> float:
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return 0.0
 
 
-def _lambda_weight(lam: float):
-    def weight(u, v, data):
-        time_s = float(data.get("time_s", data.get("time", 1.0)))
-        emissions = _edge_emissions(data)
-        time_norm = time_s / TIME_NORM_FACTOR
-        emis_norm = emissions / EMISSION_NORM_FACTOR
-        return lam * time_norm + (1.0 - lam) * emis_norm
+def _edge_terms_table(graph) -> Dict[Tuple[str, str], Tuple[float, float]]:
+    """
+    Pré-calcula `(tempo normalizado, emissões normalizadas)` para todas as
+    arestas do grafo numa só passagem vetorizada.
 
-    return weight
+    Serve de cache partilhada por todos os cenários de um lote; arestas que
+    não estejam na tabela (p.ex. adicionadas depois) são calculadas à parte
+    por `normalized_edge_terms`.
+    """
+    G = graph.G if hasattr(graph, "G") else graph
+    keys: List[Tuple[str, str]] = []
+    times: List[float] = []
+    distances: List[float] = []
+    factors: List[float] = []
+    emission_g_per_km = {"stcp": EMISSION_STCP_G_PER_KM, "metro": EMISSION_METRO_G_PER_KM}
+    for u, v, data in G.edges(data=True):
+        keys.append((u, v))
+        times.append(float(data.get("time_s", data.get("time", 1.0))))
+        distances.append(float(data.get("distance_m", 0.0)))
+        factors.append(emission_g_per_km.get(data.get("mode"), 0.0))
+    time_norm = np.asarray(times, dtype=np.float64) / TIME_NORM_FACTOR
+    emis_norm = (np.asarray(distances, dtype=np.float64) / 1000.0) * np.asarray(factors, dtype=np.float64)
+    emis_norm /= EMISSION_NORM_FACTOR
+    return dict(zip(keys, zip(time_norm.tolist(), emis_norm.tolist())))
+
+
+def _path_terms(
+    path: Sequence[str],
+    graph,
+    cache: Dict[Tuple[str, str], Tuple[float, float]],
+) -> Tuple[float, float]:
+    """Soma dos termos normalizados (tempo, emissões) ao longo do caminho."""
+    adj = (graph.G if hasattr(graph, "G") else graph).adj
+    cached = cache.get
+    time_total = 0.0
+    emis_total = 0.0
+    for u, v in zip(path[:-1], path[1:]):
+        terms = cached((u, v))
+        if terms is None:
+            # Só se consulta a adjacência quando a aresta ainda não está em cache.
+            terms = cache[(u, v)] = normalized_edge_terms(adj[u][v])
+        time_total += terms[0]
+        emis_total += terms[1]
+    return time_total, emis_total
 
 
-def _accumulate_weight(path: Iterable[str], graph, lam: float) -> float:
-    weight_fn = _lambda_weight(lam)
-    total = 0.0
-    for u, v in zip(path[:-1], path[1:]):
-        data = graph.G[u][v] if hasattr(graph, "G") else graph[u][v]
-        total += weight_fn(u, v, data)
-    return total
+def _accumulate_weight(
+    path: Iterable[str],
+    graph,
+    lam: float,
+    cache: Dict[Tuple[str, str], Tuple[float, float]] | None = None,
+) -> float:
+    # O peso é linear em λ: basta somar cada termo uma vez e combinar no fim.
+    time_norm, emis_norm = _path_terms(path, graph, cache if cache is not None else {})
+    return lam * time_norm + (1.0 - lam) * emis_norm
+
+
+# A partir deste número de soluções o varrimento NumPy compensa o custo fixo
+# face à janela BNL (medido com pontos aleatórios em 2D).
+_PARETO_SWEEP_MIN_SIZE = 16
 
 
-def _pareto_filter_solutions(solutions: List[BaselineSolution]) -> List[BaselineSolution]:
+def _pareto_sweep(solutions: List[BaselineSolution]) -> List[BaselineSolution]:
     """
-    Filtra a lista de soluções baseline, removendo entradas dominadas em 2D
-    (minimização de time_total_s e emissions_g).
+    Filtro Pareto 2D por varrimento: ordena por (tempo, emissões) e mantém os
+    pontos cujas emissões melhoram estritamente o mínimo anterior.
+    """
+    k = len(solutions)
+    inf = float("inf")
+    times = np.fromiter((sol.metrics.get("time_total_s", inf) for sol in solutions), dtype=np.float64, count=k)
+    emis = np.fromiter((sol.metrics.get("emissions_g", inf) for sol in solutions), dtype=np.float64, count=k)
+    order = np.lexsort((emis, times))
+    times_sorted = times[order]
+    emis_sorted = emis[order]
+    cummin = np.minimum.accumulate(emis_sorted)
+    on_front = np.empty(k, dtype=bool)
+    on_front[0] = True
+    on_front[1:] = emis_sorted[1:] < cummin[:-1]
+    # Pontos repetidos (adjacentes após ordenar) herdam o estado do primeiro.
+    repeated = (times_sorted[1:] == times_sorted[:-1]) & (emis_sorted[1:] == emis_sorted[:-1])
+    for pos in np.flatnonzero(repeated) + 1:
+        on_front[pos] = on_front[pos - 1]
+    keep = np.empty(k, dtype=bool)
+    keep[order] = on_front
+    return [sol for sol, is_kept in zip(solutions, keep) if is_kept]
+
+
+def _is_pareto_front_nd(points: np.ndarray) -> np.ndarray:
+    """
+    Máscara dos pontos não-dominados (minimização) em d dimensões.
+
+    Percorre os pontos por ordem lexicográfica: o primeiro que resta nunca é
+    dominado pelos seguintes, entra na frente e elimina de uma vez (em NumPy)
+    todos os que domina. Pontos iguais não se dominam entre si.
+    """
+    order = np.lexsort(points.T[::-1])
+    remaining = points[order]
+    on_front = np.zeros(len(points), dtype=bool)
+    while len(order):
+        first = remaining[0]
+        on_front[order[0]] = True
+        dominated = (remaining >= first).all(axis=1) & (remaining > first).any(axis=1)
+        dominated[0] = True  # o próprio ponto sai da lista a processar
+        order = order[~dominated]
+        remaining = remaining[~dominated]
+    return on_front
+
+
+def _pareto_filter_solutions(
+    solutions: List[BaselineSolution],
+    objectives: Sequence[str] = ("time_total_s", "emissions_g"),
+) -> List[BaselineSolution]:
+    """
+    Filtra a lista de soluções baseline, removendo entradas dominadas
+    (minimização das métricas em `objectives`; por omissão time_total_s e
+    emissions_g, em 2D).
     """
     if not solutions:
         return []
+    if len(objectives) > 2:
+        inf = float("inf")
+        points = np.array(
+            [[float(sol.metrics.get(key, inf)) for key in objectives] for sol in solutions],
+            dtype=np.float64,
+        )
+        keep = _is_pareto_front_nd(points)
+        return [sol for sol, is_kept in zip(solutions, keep) if is_kept]
+    if len(solutions) >= _PARETO_SWEEP_MIN_SIZE:
+        return _pareto_sweep(solutions)
+
+    # Block-nested-loop: janela com os pontos não-dominados vistos até agora.
+    # Para k pequeno evita ordenar e termina cedo quando um ponto da janela
+    # domina o candidato. Pontos iguais não se dominam entre si.
+    window: List[Tuple[float, float, int]] = []
+    for idx, sol in enumerate(solutions):
+        t = float(sol.metrics.get("time_total_s", float("inf")))
+        e = float(sol.metrics.get("emissions_g", float("inf")))
+        if any(
+            pt <= t and pe <= e and (pt < t or pe < e)
+            for pt, pe, _ in window
+        ):
+            continue
+        window = [
+            (pt, pe, j)
+            for pt, pe, j in window
+            if not (t <= pt and e <= pe and (t < pt or e < pe))
+        ]
+        window.append((t, e, idx))
+    return [solutions[j] for _, _, j in window]
 
-    points: List[Tuple[float, float]] = []
-    for sol in solutions:
-        m = sol.metrics
-        t = float(m.get("time_total_s", float("inf")))
-        e = float(m.get("emissions_g", float("inf")))
-        points.append((t, e))
-
-    pareto: List[BaselineSolution] = []
-    for i, (ti, ei) in enumerate(points):
-        dominated = False
-        for j, (tj, ej) in enumerate(points):
-            if j == i:
-                continue
-            if tj <= ti and ej <= ei and (tj < ti or ej < ei):
-                dominated = True
-                break
-        if not dominated:
-            pareto.append(solutions[i])
-    return pareto
+
+def _paths_by_lambda(
+    graph,
+    origin: str,
+    dests: Sequence[str],
+    lambdas: Sequence[float],
+    edge_cache: Dict[Tuple[str, str], Tuple[float, float]],
+) -> Dict[str, List[Optional[List[str]]]]:
+    """
+    Caminho de Dijkstra para cada destino e cada λ (ou None se não existir).
+
+    O custo é linear em λ, logo se dois valores λa < λb devolvem o mesmo
+    caminho, esse caminho é ótimo para todo o intervalo [λa, λb] e os λ
+    intermédios não precisam de nova pesquisa (bisseção sobre os λ ordenados).
+    Com vários destinos para a mesma origem faz-se uma única pesquisa
+    single-source por λ, partilhada por todos eles.
+    """
+    order = sorted(range(len(lambdas)), key=lambda i: lambdas[i])
+    searched: Dict[int, Dict[str, Optional[List[str]]]] = {}
+    single_source = len(dests) > 1 and hasattr(graph, "shortest_paths_from")
+
+    def search(idx: int) -> Dict[str, Optional[List[str]]]:
+        found = searched.get(idx)
+        if found is not None:
+            return found
+        weight = lambda_weight(lambdas[idx], edge_cache)
+        found = {}
+        if single_source:
+            try:
+                reach = graph.shortest_paths_from(origin, weight=weight)
+            except Exception:
+                reach = {}
+            for dest in dests:
+                found[dest] = reach.get(dest)
+        else:
+            for dest in dests:
+                try:
+                    found[dest] = graph.shortest_path_between(origin, dest, weight=weight)
+                except Exception:
+                    found[dest] = None
+        searched[idx] = found
+        return found
+
+    all_paths: Dict[str, List[Optional[List[str]]]] = {}
+    for dest in dests:
+        paths: List[Optional[List[str]]] = [None] * len(lambdas)
+
+        def solve(pos: int) -> Optional[List[str]]:
+            idx = order[pos]
+            paths[idx] = search(idx)[dest]
+            return paths[idx]
+
+        def bisect(lo: int, hi: int) -> None:
+            if hi - lo < 2:
+                return
+            if paths[order[lo]] == paths[order[hi]]:
+                for pos in range(lo + 1, hi):
+                    paths[order[pos]] = paths[order[lo]]
+                return
+            mid = (lo + hi) // 2
+            solve(mid)
+            bisect(lo, mid)
+            bisect(mid, hi)
+
+        if lambdas:
+            solve(0)
+            solve(len(order) - 1)
+            bisect(0, len(order) - 1)
+        all_paths[dest] = paths
+    return all_paths
 
 
 def run_baseline_dijkstra(
@@ -91,24 +262,37 @@ def run_baseline_dijkstra(
     lambdas: Sequence[float] | None = None,
     w_max: float | None = None,
     t_max: int | None = None,
+    paths: Sequence[Optional[List[str]]] | None = None,
+    edge_cache: Dict[Tuple[str, str], Tuple[float, float]] | None = None,
 ) -> List[BaselineSolution]:
+    """
+    Baseline Dijkstra-λ para um par origem/destino.
+
+    `paths` permite passar os caminhos por λ já calculados (por exemplo, por
+    uma pesquisa partilhada entre cenários com a mesma origem) e `edge_cache`
+    a tabela de termos por aresta (ver `_edge_terms_table`).
+    """
     if lambdas is None:
         lambdas = DEFAULT_LAMBDAS
 
     solutions: List[BaselineSolution] = []
     seen_paths: set[Tuple[str, ...]] = set()
+    if edge_cache is None:
+        # Termos por aresta independentes de λ; vive apenas durante este cenário.
+        edge_cache = {}
+    if paths is None:
+        paths = _paths_by_lambda(graph, origin, [dest], lambdas, edge_cache)[dest]
 
-    for lam in lambdas:
-        try:
-            path = graph.shortest_path_between(origin, dest, weight=_lambda_weight(lam))
-        except Exception:
-            continue
+    for lam, path in zip(lambdas, paths):
         if not path or len(path) < 2:
             continue
 
         key = tuple(path)
         if key in seen_paths:
             continue
+        # Marcar já como visto: caminhos rejeitados pelos filtros abaixo também
+        # não voltam a ser avaliados por `path_metrics`.
+        seen_paths.add(key)
 
         try:
             metrics = graph.path_metrics(path)
@@ -129,12 +313,8 @@ def run_baseline_dijkstra(
             metrics["fare_cost"] = 0.0
             metrics["fare_selected"] = None
 
-        walk_time_total = 0.0
-        has_walk = False
-        for seg in segments:
-            if isinstance(seg, dict) and seg.get("mode") == "walk":
-                has_walk = True
-                walk_time_total += float(seg.get("time_s", seg.get("time", 0.0)) or 0.0)
+        walk_time_total = float(metrics.get("walk_time_s", 0.0))
+        has_walk = "walk" in (metrics.get("distance_km_by_mode") or {})
 
         if w_max is not None and walk_time_total > w_max:
             continue
@@ -152,12 +332,6 @@ def run_baseline_dijkstra(
         emissions = metrics.get("emissions_g")
         walk_m = metrics.get("walk_m")
 
-        def _safe_float(value) -> float:
-            try:
-                return float(value)
-            except (TypeError, ValueError):
-                return 0.0
-
         if any(
             value is None or _safe_float(value) >= PENALTY
             for value in (time_total, emissions, walk_m)
@@ -178,7 +352,7 @@ def run_baseline_dijkstra(
             "fare_selected": metrics.get("fare_selected"),
             "walk_time_s": walk_time_total,
         }
-        weight_value = _accumulate_weight(path, graph, lam)
+        weight_value = _accumulate_weight(path, graph, lam, edge_cache)
 
         used_bridges = sorted(
             {
@@ -202,86 +376,171 @@ def run_baseline_dijkstra(
                 has_walk=has_walk,
             )
         )
-        seen_paths.add(key)
 
     return solutions
 
 
-def baseline_for_scenarios(
+def _process_scenario(
+    graph,
+    scenario_type: str,
+    index: int,
+    scenario: Dict[str, object],
+    lambdas: Sequence[float],
+    w_max: float | None,
+    t_max: int | None,
+    paths: Sequence[Optional[List[str]]] | None,
+    edge_cache: Dict[Tuple[str, str], Tuple[float, float]],
+) -> Dict[str, object]:
+    origin = scenario.get("origin")
+    dest = scenario.get("destination")
+    solutions = run_baseline_dijkstra(
+        graph,
+        origin,
+        dest,
+        lambdas=lambdas,
+        w_max=w_max,
+        t_max=t_max,
+        paths=paths,
+        edge_cache=edge_cache,
+    )
+
+    # Aplicar filtro Pareto 2D (tempo total, emissões) às soluções baseline.
+    pareto_solutions = _pareto_filter_solutions(solutions)
+
+    # Identificar extremos (mínimo tempo, mínimo emissões) dentro do conjunto.
+    min_time_idx = None
+    min_emis_idx = None
+    if pareto_solutions:
+        times = [float(sol.metrics.get("time_total_s", float("inf"))) for sol in pareto_solutions]
+        emis = [float(sol.metrics.get("emissions_g", float("inf"))) for sol in pareto_solutions]
+        min_time_idx = min(range(len(pareto_solutions)), key=lambda i: times[i])
+        min_emis_idx = min(range(len(pareto_solutions)), key=lambda i: emis[i])
+
+    serialized = []
+    for idx, sol in enumerate(pareto_solutions):
+        extreme: Optional[str] = None
+        if min_time_idx is not None and idx == min_time_idx and idx == min_emis_idx:
+            extreme = "min_time_and_emissions"
+        elif min_time_idx is not None and idx == min_time_idx:
+            extreme = "min_time"
+        elif min_emis_idx is not None and idx == min_emis_idx:
+            extreme = "min_emissions"
+
+        serialized.append(
+            {
+                "lambda": sol.lam,
+                "path": sol.path,
+                "metrics": sol.metrics,
+                "weight_value": sol.weight_value,
+                "segments": sol.segments,
+                "zones_passed": sol.zones_passed,
+                "used_bridge_ids": sol.used_bridge_ids,
+                "blocked_walk_edges_douro": sol.blocked_walk_edges_douro,
+                "has_walk": sol.has_walk,
+                "extreme": extreme,
+            }
+        )
+    scenario_id = scenario.get("id")
+    if not scenario_id:
+        scenario_id = f"{scenario_type}_{index:03d}"
+    return {
+        "type": scenario_type,
+        "id": scenario_id,
+        "index": index,
+        "origin": origin,
+        "destination": dest,
+        "length_edges_walk": scenario.get("length_edges_walk"),
+        "length_edges_shortest": scenario.get("length_edges_shortest"),
+        "solutions": serialized,
+    }
+
+
+# Estado dos processos do pool (`workers > 1`): o grafo chega uma única vez via
+# `initializer` e cada processo constrói a sua tabela de termos por aresta.
+_WORKER_GRAPH = None
+_WORKER_EDGE_CACHE: Dict[Tuple[str, str], Tuple[float, float]] = {}
+
+
+def _init_worker(graph):
+    global _WORKER_GRAPH, _WORKER_EDGE_CACHE
+    _WORKER_GRAPH = graph
+    _WORKER_EDGE_CACHE = _edge_terms_table(graph)
+
+
+def _scenario_worker(task: tuple) -> Dict[str, object]:
+    return _process_scenario(_WORKER_GRAPH, *task, _WORKER_EDGE_CACHE)
+
+
+def iter_baseline_for_scenarios(
     graph,
     scenarios: Dict[str, List[Dict[str, object]]],
     lambdas: Sequence[float] | None = None,
     w_max: float | None = None,
     t_max: int | None = None,
-) -> List[Dict[str, object]]:
-    collected: List[Dict[str, object]] = []
+    workers: int = 1,
+) -> Iterator[Dict[str, object]]:
+    """
+    Gera o resultado baseline de cada cenário, pela ordem de `scenarios`, à
+    medida que fica pronto (permite escrever em streaming sem reter tudo).
+    """
+    if lambdas is None:
+        lambdas = DEFAULT_LAMBDAS
+
+    # Agrupar destinos por origem: origens com vários destinos partilham uma
+    # pesquisa single-source por λ em vez de uma pesquisa por par.
+    dests_by_origin: Dict[str, List[str]] = {}
+    for items in scenarios.values():
+        for scenario in items:
+            origin = scenario.get("origin")
+            dest = scenario.get("destination")
+            if origin is None or dest is None:
+                continue
+            group = dests_by_origin.setdefault(origin, [])
+            if dest not in group:
+                group.append(dest)
+    edge_cache = _edge_terms_table(graph)
+    shared_paths: Dict[str, Dict[str, List[Optional[List[str]]]]] = {}
+    for origin, dests in dests_by_origin.items():
+        if len(dests) > 1:
+            shared_paths[origin] = _paths_by_lambda(graph, origin, dests, lambdas, edge_cache)
+
+    tasks = []
     for scenario_type, items in scenarios.items():
         for index, scenario in enumerate(items):
             origin = scenario.get("origin")
             dest = scenario.get("destination")
             if origin is None or dest is None:
                 continue
+            paths = shared_paths.get(origin, {}).get(dest)
+            tasks.append((scenario_type, index, scenario, lambdas, w_max, t_max, paths))
 
-            solutions = run_baseline_dijkstra(
-                graph,
-                origin,
-                dest,
-                lambdas=lambdas,
-                w_max=w_max,
-                t_max=t_max,
-            )
-
-            # Aplicar filtro Pareto 2D (tempo total, emissões) às soluções baseline.
-            pareto_solutions = _pareto_filter_solutions(solutions)
-
-            # Identificar extremos (mínimo tempo, mínimo emissões) dentro do conjunto.
-            min_time_idx = None
-            min_emis_idx = None
-            if pareto_solutions:
-                times = [float(sol.metrics.get("time_total_s", float("inf"))) for sol in pareto_solutions]
-                emis = [float(sol.metrics.get("emissions_g", float("inf"))) for sol in pareto_solutions]
-                min_time_idx = min(range(len(pareto_solutions)), key=lambda i: times[i])
-                min_emis_idx = min(range(len(pareto_solutions)), key=lambda i: emis[i])
-
-            serialized = []
-            for idx, sol in enumerate(pareto_solutions):
-                extreme: Optional[str] = None
-                if min_time_idx is not None and idx == min_time_idx and idx == min_emis_idx:
-                    extreme = "min_time_and_emissions"
-                elif min_time_idx is not None and idx == min_time_idx:
-                    extreme = "min_time"
-                elif min_emis_idx is not None and idx == min_emis_idx:
-                    extreme = "min_emissions"
-
-                serialized.append(
-                    {
-                        "lambda": sol.lam,
-                        "path": sol.path,
-                        "metrics": sol.metrics,
-                        "weight_value": sol.weight_value,
-                        "segments": sol.segments,
-                        "zones_passed": sol.zones_passed,
-                        "used_bridge_ids": sol.used_bridge_ids,
-                        "blocked_walk_edges_douro": sol.blocked_walk_edges_douro,
-                        "has_walk": sol.has_walk,
-                        "extreme": extreme,
-                    }
-                )
-            scenario_id = scenario.get("id")
-            if not scenario_id:
-                scenario_id = f"{scenario_type}_{index:03d}"
-            collected.append(
-                {
-                    "type": scenario_type,
-                    "id": scenario_id,
-                    "index": index,
-                    "origin": origin,
-                    "destination": dest,
-                    "length_edges_walk": scenario.get("length_edges_walk"),
-                    "length_edges_shortest": scenario.get("length_edges_shortest"),
-                    "solutions": serialized,
-                }
-            )
-    return collected
+    if workers > 1 and len(tasks) > 1:
+        with ProcessPoolExecutor(
+            max_workers=min(workers, len(tasks)),
+            initializer=_init_worker,
+            initargs=(graph,),
+        ) as executor:
+            yield from executor.map(_scenario_worker, tasks)
+        return
+    for task in tasks:
+        yield _process_scenario(graph, *task, edge_cache)
 
 
+def baseline_for_scenarios(
+    graph,
+    scenarios: Dict[str, List[Dict[str, object]]],
+    lambdas: Sequence[float] | None = None,
+    w_max: float | None = None,
+    t_max: int | None = None,
+    workers: int = 1,
+) -> List[Dict[str, object]]:
+    return list(
+        iter_baseline_for_scenarios(
+            graph,
+            scenarios,
+            lambdas=lambdas,
+            w_max=w_max,
+            t_max=t_max,
+            workers=workers,
+        )
+    )
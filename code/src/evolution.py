@@ -1,6 +1,9 @@
 import random
-from typing import Iterable, List, Sequence
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+from typing import Dict, Iterable, List, Sequence, Tuple
 
+import numpy as np
 from deap import base, creator, tools
 from constants import EMISSION_METRO_G_PER_KM, EMISSION_STCP_G_PER_KM, PENALTY
 from fitness import fitness_from_metrics
@@ -28,32 +31,33 @@ def individual_from_path(path: Iterable):
     return ACTIVE_INDIVIDUAL_CLASS(list(path))
 
 
+_PENALTY_TUPLE_3 = (PENALTY,) * 3
+_PENALTY_TUPLE_4 = (PENALTY,) * 4
+
+
 def _penalty_tuple(include_cost: bool):
-    return (PENALTY,) * (4 if include_cost else 3)
+    return _PENALTY_TUPLE_4 if include_cost else _PENALTY_TUPLE_3
 
 
 def evaluate_individual(graph, individual, walk_policy=None, w_max=None, t_max=None, include_cost=False):
     try:
-        metrics = graph.path_metrics(list(individual))
+        metrics = graph.path_metrics(list(individual), include_segments=False)
     except Exception:
         return _penalty_tuple(include_cost)
 
     if not isinstance(metrics, dict):
         return _penalty_tuple(include_cost)
 
-    if metrics.get("time_total_s", PENALTY) >= PENALTY or metrics.get("emissions_g", PENALTY) >= PENALTY:
+    get = metrics.get
+    if get("time_total_s", PENALTY) >= PENALTY or get("emissions_g", PENALTY) >= PENALTY:
         return _penalty_tuple(include_cost)
 
-    segments = metrics.get("segments") or []
-    walk_time_total = 0.0
-    for seg in segments:
-        if isinstance(seg, dict) and seg.get("mode") == "walk":
-            walk_time_total += float(seg.get("time_s", 0.0))
+    walk_time_total = float(get("walk_time_s", 0.0))
 
     if w_max is not None and walk_time_total > w_max:
         return _penalty_tuple(include_cost)
 
-    transfers = metrics.get("n_transfers")
+    transfers = get("n_transfers")
     if t_max is not None and transfers is not None:
         try:
             transfers_val = int(transfers)
@@ -65,7 +69,7 @@ def evaluate_individual(graph, individual, walk_policy=None, w_max=None, t_max=N
     fitness_values = fitness_from_metrics(metrics, walk_policy=walk_policy)
 
     if include_cost:
-        fare_cost = metrics.get("fare_cost", PENALTY)
+        fare_cost = get("fare_cost", PENALTY)
         try:
             fare_cost = float(fare_cost)
         except (TypeError, ValueError):
@@ -75,81 +79,261 @@ def evaluate_individual(graph, individual, walk_policy=None, w_max=None, t_max=N
     return fitness_values
 
 
+def evaluate_batch(toolbox, individuals, cache: Dict[tuple, tuple] | None = None):
+    """
+    Atribui o fitness a um lote de indivíduos, avaliando cada caminho distinto
+    uma única vez. Os pais copiados sem alterações para a descendência (e
+    caminhos repetidos entre gerações) reutilizam o valor em `cache`.
+
+    Os caminhos por avaliar passam por `toolbox.map`, que pode estar ligado a
+    um pool de processos (ver `run_nsga2(workers=...)`).
+    """
+    if cache is None:
+        cache = {}
+    pending: Dict[tuple, List] = {}
+    for ind in individuals:
+        key = tuple(ind)
+        values = cache.get(key)
+        if values is None:
+            pending.setdefault(key, []).append(ind)
+        else:
+            ind.fitness.values = values
+    if not pending:
+        return
+    keys = list(pending)
+    for key, values in zip(keys, toolbox.map(toolbox.evaluate, [list(key) for key in keys])):
+        values = cache[key] = tuple(values)
+        for ind in pending[key]:
+            ind.fitness.values = values
+
+
+# Grafo dos processos do pool de avaliação, enviado uma única vez via `initializer`.
+_EVAL_GRAPH = None
+
+
+def _init_eval_worker(graph):
+    global _EVAL_GRAPH
+    _EVAL_GRAPH = graph
+
+
+def _evaluate_in_worker(path, walk_policy=None, w_max=None, t_max=None, include_cost=False):
+    return evaluate_individual(
+        _EVAL_GRAPH,
+        path,
+        walk_policy=walk_policy,
+        w_max=w_max,
+        t_max=t_max,
+        include_cost=include_cost,
+    )
+
+
 def cx_path(p1, p2):
-    set1 = set(p1); set2 = set(p2)
-    commons = list(set1 & set2)
+    if p1 == p2:  # pais iguais: qualquer corte devolve o próprio caminho
+        return individual_from_path(dict.fromkeys(p1)),
+    # posição da primeira ocorrência de cada nó: evita `list.index` por corte
+    pos1 = {}
+    for i, n in enumerate(p1):
+        pos1.setdefault(n, i)
+    pos2 = {}
+    for i, n in enumerate(p2):
+        pos2.setdefault(n, i)
+    commons = [(i1, pos2[n]) for n, i1 in pos1.items() if n in pos2]
     if not commons:
         return individual_from_path(p1[:]),
-    cut = random.choice(commons)
-    i1 = p1.index(cut); i2 = p2.index(cut)
+    i1, i2 = random.choice(commons)
     child = p1[:i1] + p2[i2:]
-    seen = set(); cleaned = []
-    for n in child:
-        if n in seen:
+    return individual_from_path(dict.fromkeys(child)),
+
+
+def _crowding_distances(front) -> np.ndarray:
+    """Distância de crowding com a mesma aritmética e desempates de `tools.assignCrowdingDist`."""
+    values = np.array([ind.fitness.values for ind in front], dtype=np.float64)
+    n, nobj = values.shape
+    distances = np.zeros(n)
+    order = np.arange(n)
+    for i in range(nobj):
+        # ordenação estável sobre a ordem do objetivo anterior (como `crowd.sort`)
+        order = order[np.argsort(values[order, i], kind="stable")]
+        distances[order[0]] = np.inf
+        distances[order[-1]] = np.inf
+        lo, hi = values[order[0], i], values[order[-1], i]
+        if hi == lo:
             continue
-        seen.add(n); cleaned.append(n)
-    return individual_from_path(cleaned),
-
-
-def mut_path(graph, path, mut_rate=0.5):
-    if random.random() > mut_rate or len(path) < 4:
-        return individual_from_path(path),
-    a = random.randrange(0, len(path) - 2)
-    b = random.randrange(a + 2, min(len(path), a + 6))
-    start, end = path[a], path[b]
-
-    lam = random.random()  # mistura objetivos
-
-    def w(u, v, d):
-        t = d.get("time", 1.0)
-        dist_km = d.get("distance_m", 0.0) / 1000.0
-        mode = d.get("mode")
-        if mode == "stcp":
-            ef = EMISSION_STCP_G_PER_KM
-        elif mode == "metro":
-            ef = EMISSION_METRO_G_PER_KM
-        else:
-            ef = 0.0
-        emis = dist_km * ef
-        return lam * t + (1 - lam) * emis
+        norm = nobj * float(hi - lo)
+        distances[order[1:-1]] += (values[order[2:], i] - values[order[:-2], i]) / norm
+    return distances
+
+
+def sel_nsga2(individuals, k):
+    """
+    Seleção NSGA-II equivalente a `tools.selNSGA2` (mesmas frentes, mesma
+    ordem e mesmos desempates), mas com a matriz de dominância calculada de
+    uma vez em NumPy em vez de comparações par-a-par em Python.
+    """
+    if k == 0 or not individuals:
+        return []
+
+    # indivíduos agrupados por fitness, pela ordem da primeira ocorrência
+    groups: Dict[tuple, List] = {}
+    for ind in individuals:
+        groups.setdefault(ind.fitness.wvalues, []).append(ind)
+    fits = list(groups)
+    members = list(groups.values())
+
+    wvalues = np.array(fits, dtype=np.float64)
+    ge = (wvalues[:, None, :] >= wvalues[None, :, :]).all(axis=2)
+    gt = (wvalues[:, None, :] > wvalues[None, :, :]).any(axis=2)
+    dominates = ge & gt  # dominates[a, b]: a domina b
+    n_dominators = dominates.sum(axis=0).tolist()
+
+    current = [f for f, count in enumerate(n_dominators) if count == 0]
+    fronts = [[ind for f in current for ind in members[f]]]
+    pareto_sorted = len(fronts[0])
+    N = min(len(individuals), k)
+    while pareto_sorted < N:
+        fronts.append([])
+        next_front = []
+        for p in current:
+            for d in np.flatnonzero(dominates[p]).tolist():
+                n_dominators[d] -= 1
+                if n_dominators[d] == 0:
+                    next_front.append(d)
+                    pareto_sorted += len(members[d])
+                    fronts[-1].extend(members[d])
+        current = next_front
+
+    distances = []
+    for front in fronts:
+        dist = _crowding_distances(front)
+        for ind, value in zip(front, dist.tolist()):
+            ind.fitness.crowding_dist = value
+        distances.append(dist)
+
+    chosen = [ind for front in fronts[:-1] for ind in front]
+    remaining = k - len(chosen)
+    if remaining > 0:
+        last = fronts[-1]
+        order = np.argsort(-distances[-1], kind="stable")[:remaining]
+        chosen.extend(last[i] for i in order.tolist())
+    return chosen
 
-    try:
-        sub = graph.shortest_path_between(start, end, weight=w)
-        newp = path[:a] + sub + path[b + 1 :]
-        seen = set(); cleaned = []
-        for n in newp:
-            if n in seen:
-                continue
-            seen.add(n); cleaned.append(n)
-        if cleaned == path:  # ainda igual? tenta outra vez uma vez
-            return mut_path(graph, path, mut_rate)
-        return individual_from_path(cleaned),
-    except Exception:
-        return individual_from_path(path),
+
+def _edge_emissions(data: dict) -> float:
+    dist_km = float(data.get("distance_m", 0.0)) / 1000.0
+    mode = data.get("mode")
+    if mode == "stcp":
+        return dist_km * EMISSION_STCP_G_PER_KM
+    if mode == "metro":
+        return dist_km * EMISSION_METRO_G_PER_KM
+    return 0.0
+
+
+def _mutation_edge_terms(d: dict) -> Tuple[float, float]:
+    # a mutação pesa tempo e emissões sem normalização
+    return d.get("time", 1.0), _edge_emissions(d)
+
+
+def normalized_edge_terms(data: dict) -> Tuple[float, float]:
+    """`(tempo, emissões)` normalizados de uma aresta, para os pesos Dijkstra-λ."""
+    time_s = float(data.get("time_s", data.get("time", 1.0)))
+    return time_s / TIME_NORM_FACTOR, _edge_emissions(data) / EMISSION_NORM_FACTOR
+
+
+def lambda_weight(
+    lam: float,
+    cache: Dict[tuple, Tuple[float, float]] | None = None,
+    edge_terms=normalized_edge_terms,
+):
+    """
+    Peso `λ·tempo + (1-λ)·emissões` para `shortest_path`.
+
+    Os termos de cada aresta não dependem de λ: `edge_terms` só é chamado na
+    primeira vez que a aresta aparece e o resultado fica em `cache`, que pode
+    ser partilhado entre valores de λ (desde que com o mesmo `edge_terms`).
+    """
+    if cache is None:
+        cache = {}
+    one_minus_lam = 1.0 - lam
+    cached = cache.get
+
+    def weight(u, v, data):
+        terms = cached((u, v))
+        if terms is None:
+            terms = cache[(u, v)] = edge_terms(data)
+        return lam * terms[0] + one_minus_lam * terms[1]
+
+    return weight
+
+
+# Tentativas de mutação quando o sub-caminho não altera o indivíduo.
+MUT_PATH_MAX_ATTEMPTS = 3
+
+
+def mut_path(graph, path, mut_rate=0.5, edge_cache: Dict[tuple, Tuple[float, float]] | None = None):
+    if edge_cache is None:
+        edge_cache = {}
+    for _ in range(MUT_PATH_MAX_ATTEMPTS):
+        if random.random() > mut_rate or len(path) < 4:
+            return individual_from_path(path),
+        a = random.randrange(0, len(path) - 2)
+        b = random.randrange(a + 2, min(len(path), a + 6))
+        start, end = path[a], path[b]
+
+        lam = random.random()  # mistura objetivos
+
+        try:
+            sub = graph.shortest_path_between(start, end, weight=lambda_weight(lam, edge_cache, _mutation_edge_terms))
+        except Exception:
+            return individual_from_path(path),
+        cleaned = list(dict.fromkeys(path[:a] + sub + path[b + 1 :]))
+        if cleaned != path:
+            return individual_from_path(cleaned),
+        # ainda igual? tenta outra vez com novos a, b e λ
+    return individual_from_path(path),
 
 
 def initialize_toolbox(graph, origin, dest, include_cost=False, walk_policy=None, w_max=None, t_max=None):
     set_active_individual(include_cost)
     toolbox = base.Toolbox()
 
-    def noisy_weight(u, v, d):
-        base_time = d.get("time", 1.0)
-        return base_time * (1.0 + 0.3 * (random.random() - 0.5))
+    # Ruído de ±15% por aresta, sorteado uma vez por caminho (e não a cada
+    # relaxação), para que cada Dijkstra veja pesos consistentes.
+    edge_index: Dict[tuple, int] = {}
+    base_times: List[float] = []
+
+    def noisy_weight():
+        if not edge_index:
+            for u, v, d in graph.G.edges(data=True):
+                edge_index[(u, v)] = len(base_times)
+                base_times.append(d.get("time", 1.0))
+        # gerador derivado de `random` para manter a reprodutibilidade por seed
+        rng = np.random.default_rng(random.getrandbits(64))
+        noisy_time = (rng.uniform(0.85, 1.15, size=len(base_times)) * np.asarray(base_times)).tolist()
+        index = edge_index.__getitem__
+        return lambda u, v, d: noisy_time[index((u, v))]
+
+    # Caches desta execução (o grafo pode mudar entre execuções, p.ex. com
+    # pontos virtuais): termos por aresta da mutação e o caminho mais rápido
+    # usado quando o random walk falha.
+    mutation_edge_cache: Dict[tuple, Tuple[float, float]] = {}
+    fastest_path: List = []
 
     def random_valid_path():
         if random.random() < 0.5:
-            sp = graph.shortest_path_between(origin, dest, weight=noisy_weight)
+            sp = graph.shortest_path_between(origin, dest, weight=noisy_weight())
             return individual_from_path(sp)
         p = graph.random_walk(origin, dest)
         if not p:
-            p = graph.shortest_path_between(origin, dest)
+            if not fastest_path:
+                fastest_path.extend(graph.shortest_path_between(origin, dest))
+            p = fastest_path
         return individual_from_path(p)
 
     toolbox.register('individual', random_valid_path)
     toolbox.register('population', tools.initRepeat, list, toolbox.individual)
     toolbox.register('mate', cx_path)
-    toolbox.register('mutate', lambda ind: mut_path(graph, list(ind)))
-    toolbox.register('select', tools.selNSGA2)
+    toolbox.register('mutate', lambda ind: mut_path(graph, list(ind), edge_cache=mutation_edge_cache))
+    toolbox.register('select', sel_nsga2)
     toolbox.register(
         'evaluate',
         lambda ind: evaluate_individual(
@@ -164,41 +348,32 @@ def initialize_toolbox(graph, origin, dest, include_cost=False, walk_policy=None
     return toolbox
 
 
-def _edge_emissions(data: dict) -> float:
-    dist_km = float(data.get("distance_m", 0.0)) / 1000.0
-    mode = data.get("mode")
-    if mode == "stcp":
-        return dist_km * EMISSION_STCP_G_PER_KM
-    if mode == "metro":
-        return dist_km * EMISSION_METRO_G_PER_KM
-    return 0.0
-
-
-def _lambda_weight(lam: float):
-    def weight(u, v, data):
-        time_s = float(data.get("time_s", data.get("time", 1.0)))
-        emissions = _edge_emissions(data)
-        time_norm = time_s / TIME_NORM_FACTOR
-        emis_norm = emissions / EMISSION_NORM_FACTOR
-        return lam * time_norm + (1.0 - lam) * emis_norm
-
-    return weight
-
-
-def generate_seed_paths(graph, origin, dest, lambdas: Sequence[float]) -> List[List]:
-    seeds: List[List] = []
-    seen = set()
+def generate_seed_paths(
+    graph,
+    origin,
+    dest,
+    lambdas: Sequence[float],
+    max_paths: int | None = None,
+    shuffle: bool = False,
+) -> List[List]:
+    """
+    Caminhos distintos de Dijkstra-λ. Com `shuffle` os λ são percorridos por ordem
+    aleatória, e com `max_paths` pára assim que há caminhos suficientes.
+    """
+    if shuffle:
+        lambdas = list(lambdas)
+        random.shuffle(lambdas)
+    seeds: Dict[tuple, List] = {}
+    edge_cache: Dict[tuple, Tuple[float, float]] = {}
     for lam in lambdas:
         try:
-            path = graph.shortest_path_between(origin, dest, weight=_lambda_weight(lam))
+            path = graph.shortest_path_between(origin, dest, weight=lambda_weight(lam, edge_cache))
         except Exception:
             continue
-        tpl = tuple(path)
-        if tpl in seen:
-            continue
-        seen.add(tpl)
-        seeds.append(list(path))
-    return seeds
+        seeds.setdefault(tuple(path), list(path))
+        if max_paths is not None and len(seeds) >= max_paths:
+            break
+    return list(seeds.values())
 
 
 def run_nsga2(
@@ -214,6 +389,8 @@ def run_nsga2(
     t_max=None,
     include_cost=False,
     seed_lambdas: Sequence[float] | None = None,
+    workers: int = 1,
+    verbose: bool = True,
 ):
     if pop_size % 4 != 0:
         pop_size += 4 - (pop_size % 4)
@@ -231,27 +408,60 @@ def run_nsga2(
         t_max=t_max,
     )
 
-    seed_paths = generate_seed_paths(graph, origin, dest, seed_lambdas)
-    random.shuffle(seed_paths)
+    executor = None
+    if workers > 1:
+        # Avaliação em paralelo: o grafo vai para cada processo uma única vez e
+        # por tarefa só circula o caminho (lista de nós).
+        executor = ProcessPoolExecutor(
+            max_workers=workers,
+            initializer=_init_eval_worker,
+            initargs=(graph,),
+        )
+        toolbox.register(
+            'evaluate',
+            partial(
+                _evaluate_in_worker,
+                walk_policy=walk_policy,
+                w_max=w_max,
+                t_max=t_max,
+                include_cost=include_cost,
+            ),
+        )
+        toolbox.register(
+            'map',
+            lambda fn, paths: executor.map(fn, paths, chunksize=max(1, len(paths) // (4 * workers))),
+        )
+    try:
+        return _run_generations(toolbox, graph, origin, dest, pop_size, ngen, cxpb, mutpb, seed_lambdas, verbose)
+    finally:
+        if executor is not None:
+            executor.shutdown()
+
+
+def _run_generations(toolbox, graph, origin, dest, pop_size, ngen, cxpb, mutpb, seed_lambdas, verbose):
+    seed_paths = generate_seed_paths(graph, origin, dest, seed_lambdas, max_paths=pop_size, shuffle=True)
 
-    pop: List = [individual_from_path(path) for path in seed_paths[:pop_size]]
+    pop: List = [individual_from_path(path) for path in seed_paths]
 
     while len(pop) < pop_size:
         pop.append(toolbox.individual())
 
-    uniq = {}
-    for ind in pop:
-        uniq[tuple(ind)] = ind
-    pop = list(uniq.values())
+    pop = list({tuple(ind): ind for ind in pop}.values())
     while len(pop) < pop_size:
         pop.append(toolbox.individual())
 
-    for ind in pop:
-        ind.fitness.values = toolbox.evaluate(ind)
+    # fitness por caminho, partilhado por todas as gerações desta execução
+    fitness_cache: Dict[tuple, tuple] = {}
+    evaluate_batch(toolbox, pop, fitness_cache)
 
     for g in range(1, ngen + 1):
-        offspring = toolbox.select(pop, len(pop))
-        offspring = [individual_from_path(list(ind)) for ind in offspring]
+        # Cópias dos selecionados herdam o fitness; só os indivíduos novos
+        # (cruzamento, mutação, preenchimento) ficam por avaliar.
+        offspring = []
+        for ind in toolbox.select(pop, len(pop)):
+            clone = individual_from_path(ind)
+            clone.fitness.values = ind.fitness.values
+            offspring.append(clone)
 
         for i in range(0, len(offspring) - 1, 2):
             if random.random() < cxpb:
@@ -268,18 +478,15 @@ def run_nsga2(
                 m1, = toolbox.mutate(offspring[i])
                 offspring[i] = m1
 
-        uniq = {}
-        for ind in offspring:
-            uniq[tuple(ind)] = ind
-        offspring = list(uniq.values())
+        offspring = list({tuple(ind): ind for ind in offspring}.values())
 
         while len(offspring) < pop_size:
             offspring.append(toolbox.individual())
 
-        for ind in offspring:
-            ind.fitness.values = toolbox.evaluate(ind)
+        evaluate_batch(toolbox, [ind for ind in offspring if not ind.fitness.valid], fitness_cache)
 
         pop = toolbox.select(pop + offspring, pop_size)
-        print(f'Generation {g} completed')
+        if verbose:
+            print(f'Generation {g} completed')
 
     return pop
@@ -4,10 +4,12 @@ import math
 import os
 import pickle
 import statistics
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
 from pathlib import Path
 from typing import Dict, List, Sequence, Tuple
 
-from baselines import baseline_for_scenarios, DEFAULT_LAMBDAS
+from baselines import iter_baseline_for_scenarios, DEFAULT_LAMBDAS
 from constants import PENALTY
 from evolution import run_nsga2
 from graph_builder import MultimodalGraph
@@ -44,7 +46,7 @@ def load_or_build_graph(
         cache_path = Path(cache_file)
         cache_path.parent.mkdir(parents=True, exist_ok=True)
         with open(cache_path, "wb") as fh:
-            pickle.dump(graph, fh)
+            pickle.dump(graph, fh, protocol=pickle.HIGHEST_PROTOCOL)
 
     return graph
 
@@ -53,7 +55,17 @@ def serialize_population(
     graph: MultimodalGraph,
     population,
     include_cost: bool = False,
+    metrics_cache: Dict[tuple, object] | None = None,
 ) -> Tuple[List[dict], Dict[str, int]]:
+    """
+    Serializa os indivíduos válidos (sem caminhos repetidos).
+
+    `metrics_cache` guarda o resultado de `path_metrics` por caminho e pode ser
+    partilhado entre chamadas (p.ex. população final e respetiva frente), para
+    que cada caminho distinto seja avaliado uma única vez.
+    """
+    if metrics_cache is None:
+        metrics_cache = {}
     solutions: List[dict] = []
     seen_paths = set()
     total_seen = 0
@@ -72,10 +84,15 @@ def serialize_population(
         if any(val >= PENALTY for val in ind.fitness.values):
             continue
 
-        try:
-            metrics = graph.path_metrics(path_raw)
-        except Exception:
-            continue
+        raw_key = tuple(path_raw)
+        if raw_key in metrics_cache:
+            metrics = metrics_cache[raw_key]
+        else:
+            try:
+                metrics = graph.path_metrics(path_raw)
+            except Exception:
+                metrics = None
+            metrics_cache[raw_key] = metrics
         if not isinstance(metrics, dict):
             continue
         if metrics.get("time_total_s", PENALTY) >= PENALTY or metrics.get("emissions_g", PENALTY) >= PENALTY:
@@ -134,13 +151,74 @@ def serialize_population(
     return solutions, stats
 
 
+def run_nsga2_for_scenario(graph: MultimodalGraph, scenario: Dict[str, object], options: Dict[str, object]) -> Dict[str, object]:
+    """
+    Corre o NSGA-II para um cenário e devolve as populações já serializadas
+    (final e frente não-dominada), prontas a gravar em JSON.
+    """
+    scenario_id = scenario["id"]
+    origin = scenario["origin"]
+    dest = scenario["destination"]
+    print(f"[NSGA-II] {scenario_id}: {origin} -> {dest}")
+    pop = run_nsga2(graph, origin, dest, **options)
+    first_front = tools.sortNondominated(pop, k=len(pop), first_front_only=True)
+    nondominated = first_front[0] if first_front else []
+    include_cost = bool(options.get("include_cost"))
+    metrics_cache: Dict[tuple, object] = {}
+    final_population, final_stats = serialize_population(
+        graph, pop, include_cost=include_cost, metrics_cache=metrics_cache
+    )
+    pareto_solutions, pareto_stats = serialize_population(
+        graph, nondominated, include_cost=include_cost, metrics_cache=metrics_cache
+    )
+    return {
+        "final_population": final_population,
+        "final_stats": final_stats,
+        "pareto_solutions": pareto_solutions,
+        "pareto_stats": pareto_stats,
+        "n_population": len(pop),
+        "n_nondominated": len(nondominated),
+    }
+
+
+# Grafo partilhado pelos processos do pool (`--workers`), enviado uma única vez
+# via `initializer` em vez de ser serializado em cada tarefa.
+_WORKER_GRAPH: MultimodalGraph | None = None
+
+
+def _init_worker(graph: MultimodalGraph):
+    global _WORKER_GRAPH
+    _WORKER_GRAPH = graph
+
+
+def _nsga2_worker(scenario: Dict[str, object], options: Dict[str, object]) -> Dict[str, object]:
+    return run_nsga2_for_scenario(_WORKER_GRAPH, scenario, options)
+
+
 def ensure_dir(path: Path):
     path.mkdir(parents=True, exist_ok=True)
 
 
-def save_json(path: Path, data):
+def save_json(path: Path, data, indent: int | None = 2):
+    """`indent=None` grava JSON compacto (ficheiros por solução, mais volumosos)."""
     with open(path, "w", encoding="utf-8") as fh:
-        json.dump(data, fh, indent=2)
+        if indent is None:
+            json.dump(data, fh, separators=(",", ":"))
+        else:
+            json.dump(data, fh, indent=indent)
+
+
+def write_json_array_item(fh, item, first: bool):
+    """
+    Escreve um elemento de um array JSON em streaming, com a mesma formatação
+    que `save_json` daria à lista completa.
+    """
+    body = json.dumps(item, indent=2).replace("\n", "\n  ")
+    fh.write(("[\n  " if first else ",\n  ") + body)
+
+
+def close_json_array(fh, empty: bool):
+    fh.write("[]" if empty else "\n]")
 
 
 def extract_points_2d(solutions: List[Dict[str, object]]) -> List[tuple[float, float]]:
@@ -191,6 +269,13 @@ def main():
         help="Valores de λ separados por vírgula para o baseline (por omissão usa 0.0,0.05,...,1.0).",
     )
     parser.add_argument("--seed-lambdas", default=None, help="Valores de λ para seeds NSGA-II (por omissão usa baseline).")
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=1,
+        help="Número de processos para correr o baseline e o NSGA-II em cenários diferentes em paralelo (1 = sequencial).",
+    )
+    parser.add_argument("--quiet", action="store_true", help="Não mostrar o progresso por geração do NSGA-II.")
 
     args = parser.parse_args()
 
@@ -239,95 +324,100 @@ def main():
 
     save_json(output_dir / "scenarios.json", scenario_records)
 
-    baseline_results = baseline_for_scenarios(
-        graph,
-        scenarios,
-        lambdas=lambdas,
-        w_max=args.wmax_s,
-        t_max=args.tmax,
-    )
-    # Índice auxiliar para aceder rapidamente às soluções baseline por cenário.
-    baseline_by_id: Dict[str, Dict[str, object]] = {
-        entry["id"]: entry for entry in baseline_results
-    }
-
-    for entry in baseline_results:
-        scenario_dir = output_dir / entry["id"]
-        ensure_dir(scenario_dir)
-        save_json(scenario_dir / "baseline_pareto.json", entry)
-    save_json(output_dir / "baseline_summary.json", baseline_results)
+    # Resultados baseline escritos em streaming: de cada cenário só se retêm os
+    # pontos 2D necessários para o hipervolume.
+    baseline_points_by_id: Dict[str, List[tuple[float, float]]] = {}
+    with open(output_dir / "baseline_summary.json", "w", encoding="utf-8") as summary_fh:
+        for i, entry in enumerate(
+            iter_baseline_for_scenarios(
+                graph,
+                scenarios,
+                lambdas=lambdas,
+                w_max=args.wmax_s,
+                t_max=args.tmax,
+                workers=args.workers,
+            )
+        ):
+            scenario_dir = output_dir / entry["id"]
+            ensure_dir(scenario_dir)
+            save_json(scenario_dir / "baseline_pareto.json", entry, indent=None)
+            baseline_points_by_id[entry["id"]] = extract_points_2d(entry.get("solutions", []))
+            write_json_array_item(summary_fh, entry, first=i == 0)
+        close_json_array(summary_fh, empty=not baseline_points_by_id)
 
     hv_summaries: List[Dict[str, object]] = []
 
-    for scenario in scenario_records:
-        scenario_id = scenario["id"]
-        origin = scenario["origin"]
-        dest = scenario["destination"]
-        print(f"[NSGA-II] {scenario_id}: {origin} -> {dest}")
-        pop = run_nsga2(
-            graph,
-            origin,
-            dest,
-            pop_size=args.pop_size,
-            ngen=args.gens,
-            walk_policy=args.walk_policy,
-            w_max=args.wmax_s,
-            t_max=args.tmax,
-            include_cost=args.include_cost,
-            seed_lambdas=seed_lambdas if seed_lambdas is not None else lambdas,
-        )
-        first_front = tools.sortNondominated(pop, k=len(pop), first_front_only=True)
-        nondominated = first_front[0] if first_front else []
-        final_population, final_stats = serialize_population(
-            graph,
-            pop,
-            include_cost=args.include_cost,
-        )
-        pareto_solutions, pareto_stats = serialize_population(
-            graph,
-            nondominated,
-            include_cost=args.include_cost,
-        )
-        print(
-            f"[pop] {scenario_id}: final={len(pop)} individuos, validos={final_stats['output_size']}, duplicados_removidos={final_stats['duplicates_removed']}"
+    nsga_options = {
+        "pop_size": args.pop_size,
+        "ngen": args.gens,
+        "walk_policy": args.walk_policy,
+        "w_max": args.wmax_s,
+        "t_max": args.tmax,
+        "include_cost": args.include_cost,
+        "seed_lambdas": seed_lambdas if seed_lambdas is not None else lambdas,
+        "verbose": not args.quiet,
+    }
+    if args.workers > 1:
+        executor = ProcessPoolExecutor(
+            max_workers=args.workers,
+            initializer=_init_worker,
+            initargs=(graph,),
         )
-        print(
-            f"[pareto] {scenario_id}: frente_raw={len(nondominated)}, validos={pareto_stats['output_size']}, duplicados_removidos={pareto_stats['duplicates_removed']}"
+        nsga_results = executor.map(_nsga2_worker, scenario_records, repeat(nsga_options))
+    else:
+        executor = None
+        nsga_results = (
+            run_nsga2_for_scenario(graph, scenario, nsga_options) for scenario in scenario_records
         )
-        scenario_dir = output_dir / scenario_id
-        ensure_dir(scenario_dir)
-        save_json(scenario_dir / "final_population.json", final_population)
-        save_json(scenario_dir / "pareto_solutions.json", pareto_solutions)
-
-        # --------- Hipervolume 2D (tempo total, emissões) para baseline vs NSGA-II --------- #
-        baseline_entry = baseline_by_id.get(scenario_id)
-
-        baseline_points = extract_points_2d(baseline_entry.get("solutions", [])) if baseline_entry else []
-        nsga_points = extract_points_2d(pareto_solutions)
-
-        baseline_points = pareto_filter_2d_min(baseline_points)
-        nsga_points = pareto_filter_2d_min(nsga_points)
-
-        ref = make_reference_from_union(baseline_points, nsga_points, margin=1.10)
-        hv_baseline = hypervolume_2d_min(baseline_points, ref) if baseline_points else 0.0
-        hv_nsga2 = hypervolume_2d_min(nsga_points, ref) if nsga_points else 0.0
 
-        points_payload = {
-            "baseline": [{"time_total_s": t, "emissions_g": e} for t, e in baseline_points],
-            "nsga2": [{"time_total_s": t, "emissions_g": e} for t, e in nsga_points],
-        }
-        save_json(scenario_dir / "pareto_front.json", points_payload)
-
-        hv_entry = {
-            "scenario_id": scenario_id,
-            "ref": {"time_total_s": ref[0], "emissions_g": ref[1]},
-            "hv_baseline": hv_baseline,
-            "hv_nsga2": hv_nsga2,
-            "n_points_baseline": len(baseline_points),
-            "n_points_nsga2": len(nsga_points),
-        }
-        save_json(scenario_dir / "hypervolume.json", hv_entry)
-        hv_summaries.append(hv_entry)
+    try:
+        for scenario, result in zip(scenario_records, nsga_results):
+            scenario_id = scenario["id"]
+            final_population = result["final_population"]
+            pareto_solutions = result["pareto_solutions"]
+            final_stats = result["final_stats"]
+            pareto_stats = result["pareto_stats"]
+            print(
+                f"[pop] {scenario_id}: final={result['n_population']} individuos, validos={final_stats['output_size']}, duplicados_removidos={final_stats['duplicates_removed']}"
+            )
+            print(
+                f"[pareto] {scenario_id}: frente_raw={result['n_nondominated']}, validos={pareto_stats['output_size']}, duplicados_removidos={pareto_stats['duplicates_removed']}"
+            )
+            scenario_dir = output_dir / scenario_id
+            ensure_dir(scenario_dir)
+            save_json(scenario_dir / "final_population.json", final_population, indent=None)
+            save_json(scenario_dir / "pareto_solutions.json", pareto_solutions, indent=None)
+
+            # --------- Hipervolume 2D (tempo total, emissões) para baseline vs NSGA-II --------- #
+            baseline_points = baseline_points_by_id.get(scenario_id, [])
+            nsga_points = extract_points_2d(pareto_solutions)
+
+            baseline_points = pareto_filter_2d_min(baseline_points)
+            nsga_points = pareto_filter_2d_min(nsga_points)
+
+            ref = make_reference_from_union(baseline_points, nsga_points, margin=1.10)
+            hv_baseline = hypervolume_2d_min(baseline_points, ref) if baseline_points else 0.0
+            hv_nsga2 = hypervolume_2d_min(nsga_points, ref) if nsga_points else 0.0
+
+            points_payload = {
+                "baseline": [{"time_total_s": t, "emissions_g": e} for t, e in baseline_points],
+                "nsga2": [{"time_total_s": t, "emissions_g": e} for t, e in nsga_points],
+            }
+            save_json(scenario_dir / "pareto_front.json", points_payload)
+
+            hv_entry = {
+                "scenario_id": scenario_id,
+                "ref": {"time_total_s": ref[0], "emissions_g": ref[1]},
+                "hv_baseline": hv_baseline,
+                "hv_nsga2": hv_nsga2,
+                "n_points_baseline": len(baseline_points),
+                "n_points_nsga2": len(nsga_points),
+            }
+            save_json(scenario_dir / "hypervolume.json", hv_entry)
+            hv_summaries.append(hv_entry)
+    finally:
+        if executor is not None:
+            executor.shutdown()
 
     # --------- Resumo global de hipervolume --------- #
     summary: Dict[str, object] = {
@@ -13,6 +13,12 @@ WALK_POLICY_MAXIMIZE = "maximize"
 WALK_POLICY_MINIMIZE = "minimize"
 DEFAULT_WALK_POLICY = os.environ.get("CIN_WALK_POLICY", WALK_POLICY_MAXIMIZE).lower()
 
+# g CO2/km por modo motorizado (evita a cadeia if/elif por aresta)
+_EMISSION_G_PER_KM = {
+    "stcp": EMISSION_STCP_G_PER_KM,
+    "metro": EMISSION_METRO_G_PER_KM,
+}
+
 
 def _resolve_walk_policy(policy: str | None) -> str:
     if policy is None:
@@ -76,10 +82,14 @@ def _evaluate_legacy_graph(graph, path: Iterable[str], policy: str) -> Tuple[flo
     total_emissions = 0.0
     walking_distance = 0.0
 
-    for u, v in zip(path[:-1], path[1:]):
-        if not graph.has_edge(u, v):
+    nodes = list(path)
+    # Uma única consulta à adjacência por aresta (em vez de has_edge + graph[u][v]).
+    adj = graph.adj
+    emission_g_per_km = _EMISSION_G_PER_KM
+    for u, v in zip(nodes, nodes[1:]):
+        data = adj.get(u, {}).get(v)
+        if data is None:
             return PENALTY, PENALTY, PENALTY
-        data = graph[u][v]
         mode = data.get("mode", "unknown")
         dist = float(data.get("distance_m", 0.0))
         time = float(data.get("time_s", data.get("time", 0.0)))
@@ -87,9 +97,9 @@ def _evaluate_legacy_graph(graph, path: Iterable[str], policy: str) -> Tuple[flo
 
         if mode == "walk":
             walking_distance += dist
-        elif mode == "stcp":
-            total_emissions += (dist / 1000.0) * EMISSION_STCP_G_PER_KM
-        elif mode == "metro":
-            total_emissions += (dist / 1000.0) * EMISSION_METRO_G_PER_KM
+        else:
+            factor = emission_g_per_km.get(mode)
+            if factor is not None:
+                total_emissions += (dist / 1000.0) * factor
 
     return total_time, total_emissions, _objective_from_walk(walking_distance, policy)
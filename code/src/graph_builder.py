@@ -2,11 +2,11 @@ import difflib
 import json
 import math
 import os
-import re
 import unicodedata
 from typing import Dict, Iterable, List, Optional, Tuple
 
 import networkx as nx
+import numpy as np
 import pandas as pd
 
 from constants import (
@@ -18,6 +18,8 @@ from constants import (
 from loader import BRIDGE_RULES, PROJECT_ROOT, load_bridge_rules
 
 WALK_RADIUS_METERS = 400
+# Folga do pré-filtro euclidiano face ao raio (erro da projeção equiretangular)
+WALK_PREFILTER_MARGIN = 1.05
 METRO_CRUISE_SPEED_KMH = 40.0
 STCP_CRUISE_SPEED_KMH = 30.0
 
@@ -32,25 +34,70 @@ DOURO_MID_LAT = 41.138
 
 _DOURO_DEBUG_COUNT = 0
 _BRIDGES_GEOMETRY_CACHE: Optional[List[dict]] = None
+# (id, lat, lon, snap_radius_m) de cada ponte válida
+BridgeRecord = Tuple[str, float, float, float]
+_BRIDGE_RECORDS: Optional[List[BridgeRecord]] = None
+_BRIDGE_ARRAYS: Optional[Tuple[List[str], np.ndarray, np.ndarray, np.ndarray]] = None
 BRIDGES_GEOMETRY_PATH = os.path.join(
     PROJECT_ROOT, "data", "bridges", "bridges_geometry.json"
 )
 
 
 def to_seconds(hms: str) -> int:
+    """
+    Converte um único valor HH:MM:SS para segundos.
+
+    Para colunas inteiras (ex.: `stop_times`) usar `to_seconds_series`, que evita
+    uma chamada Python por linha.
+    """
     h, m, s = map(int, str(hms).split(":"))
     return h * 3600 + m * 60 + s
 
 
-def haversine(lat1, lon1, lat2, lon2):
-    R = 6371000
+def to_seconds_series(values: pd.Series) -> pd.Series:
+    """
+    Versão vetorizada de `to_seconds` para uma coluna HH:MM:SS.
+
+    Valores inválidos (nulos, mal formados) resultam em NaN em vez de exceção.
+    Cada hora distinta é convertida uma única vez: num `stop_times` as mesmas
+    horas repetem-se por muitas viagens.
+    """
+    codes, uniques = pd.factorize(values)
+    parts = pd.Series(uniques, dtype=object).astype(str).str.split(":", n=2, expand=True)
+    if parts.shape[1] < 3:
+        return pd.Series(float("nan"), index=values.index, dtype="float64")
+    hours = pd.to_numeric(parts[0], errors="coerce")
+    minutes = pd.to_numeric(parts[1], errors="coerce")
+    seconds = pd.to_numeric(parts[2], errors="coerce")
+    unique_seconds = (hours * 3600 + minutes * 60 + seconds).to_numpy(dtype=np.float64)
+    # código -1 = valor nulo
+    return pd.Series(np.where(codes >= 0, unique_seconds[codes], np.nan), index=values.index, dtype="float64")
+
+
+def _haversine_term(lat1, lon1, lat2, lon2) -> float:
+    """Termo `a` de Haversine: cresce com a distância, serve para comparar."""
     phi1, phi2 = math.radians(lat1), math.radians(lat2)
     dphi = math.radians(lat2 - lat1)
     dlambda = math.radians(lon2 - lon1)
-    a = math.sin(dphi / 2) ** 2 + math.cos(phi1) * math.cos(phi2) * math.sin(dlambda / 2) ** 2
+    return math.sin(dphi / 2) ** 2 + math.cos(phi1) * math.cos(phi2) * math.sin(dlambda / 2) ** 2
+
+
+def haversine(lat1, lon1, lat2, lon2):
+    R = 6371000
+    a = _haversine_term(lat1, lon1, lat2, lon2)
     return 2 * R * math.atan2(math.sqrt(a), math.sqrt(1 - a))
 
 
+def haversine_vec(lat1, lon1, lat2, lon2) -> np.ndarray:
+    """`haversine` sobre arrays NumPy (com broadcasting), em metros."""
+    R = 6371000
+    phi1, phi2 = np.radians(lat1), np.radians(lat2)
+    dphi = np.radians(lat2 - lat1)
+    dlambda = np.radians(lon2 - lon1)
+    a = np.sin(dphi / 2) ** 2 + np.cos(phi1) * np.cos(phi2) * np.sin(dlambda / 2) ** 2
+    return 2 * R * np.arctan2(np.sqrt(a), np.sqrt(1 - a))
+
+
 def haversine_m(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
     """
     Versão explícita de Haversine que devolve a distância em metros.
@@ -89,14 +136,10 @@ def point_to_segment_distance_m(
         cos_lat = 1e-6
     meters_per_deg_lon = 111_000.0 * cos_lat
 
-    def to_xy(lat: float, lon: float) -> tuple[float, float]:
-        x = (lon - lon_a) * meters_per_deg_lon
-        y = (lat - lat_a) * meters_per_deg_lat
-        return x, y
-
+    # coordenadas locais em metros com origem em A
     ax, ay = 0.0, 0.0
-    bx, by = to_xy(lat_b, lon_b)
-    px, py = to_xy(lat_p, lon_p)
+    bx, by = (lon_b - lon_a) * meters_per_deg_lon, (lat_b - lat_a) * meters_per_deg_lat
+    px, py = (lon_p - lon_a) * meters_per_deg_lon, (lat_p - lat_a) * meters_per_deg_lat
 
     abx, aby = bx - ax, by - ay
     ab_len2 = abx * abx + aby * aby
@@ -127,16 +170,22 @@ def remove_cycles(path: Iterable[str]) -> List[str]:
         [A, B, C, B, D] -> [A, B, D]
         [A, B, C, D]    -> igual
     """
+    nodes = list(path)
+    # caso comum (caminhos do NSGA-II): sem nós repetidos, nada a cortar
+    if len(set(nodes)) == len(nodes):
+        return nodes
+
     result: List[str] = []
     last_index: Dict[str, int] = {}
 
-    for node in path:
+    for node in nodes:
         if node in last_index:
             idx = last_index[node]
-            # remover nós após idx no resultado e do mapa de índices
-            for removed in result[idx + 1 :]:
-                last_index.pop(removed, None)
-            result = result[: idx + 1]
+            # remover nós após idx no resultado e do mapa de índices, no próprio
+            # `result` (cada nó é removido no máximo uma vez: custo linear)
+            for k in range(idx + 1, len(result)):
+                last_index.pop(result[k], None)
+            del result[idx + 1 :]
         else:
             last_index[node] = len(result)
             result.append(node)
@@ -179,6 +228,17 @@ def is_douro_walk_crossing(
     return side1_north != side2_north
 
 
+def douro_crossing_mask(lat1, lon1, lat2, lon2) -> np.ndarray:
+    """`is_douro_walk_crossing` sobre arrays NumPy de pares de pontos."""
+    in_box = (
+        (lat1 >= DOURO_MIN_LAT) & (lat1 <= DOURO_MAX_LAT)
+        & (lon1 >= DOURO_MIN_LON) & (lon1 <= DOURO_MAX_LON)
+        & (lat2 >= DOURO_MIN_LAT) & (lat2 <= DOURO_MAX_LAT)
+        & (lon2 >= DOURO_MIN_LON) & (lon2 <= DOURO_MAX_LON)
+    )
+    return in_box & ((lat1 >= DOURO_MID_LAT) != (lat2 >= DOURO_MID_LAT))
+
+
 def crosses_douro(
     p1: tuple[float, float],
     p2: tuple[float, float],
@@ -229,6 +289,58 @@ def _load_bridges_geometry() -> List[dict]:
     return _BRIDGES_GEOMETRY_CACHE
 
 
+def _bridge_records(bridges_geometry: List[dict]) -> List[BridgeRecord]:
+    """Pontes válidas como registos (id, lat, lon, raio de snap) já convertidos."""
+    records: List[BridgeRecord] = []
+    for bridge in bridges_geometry:
+        try:
+            b_id = str(bridge.get("id") or "").strip()
+            b_lat = float(bridge.get("midpoint_lat"))
+            b_lon = float(bridge.get("midpoint_lon"))
+            snap_radius = float(bridge.get("snap_radius_m", 0.0))
+        except (TypeError, ValueError):
+            continue
+        if not b_id or snap_radius <= 0.0:
+            continue
+        records.append((b_id, b_lat, b_lon, snap_radius))
+    return records
+
+
+def _default_bridge_records() -> List[BridgeRecord]:
+    """Registos de `bridges_geometry.json`, validados uma única vez."""
+    global _BRIDGE_RECORDS
+    if _BRIDGE_RECORDS is None:
+        _BRIDGE_RECORDS = _bridge_records(_load_bridges_geometry())
+    return _BRIDGE_RECORDS
+
+
+def _bridge_arrays() -> Tuple[List[str], np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Geometria das pontes válidas em arrays (ids, lat, lon e raio de snap),
+    construída uma vez a partir de `_default_bridge_records`.
+    """
+    global _BRIDGE_ARRAYS
+    if _BRIDGE_ARRAYS is None:
+        records = _default_bridge_records()
+        arr = np.asarray([r[1:] for r in records], dtype=np.float64).reshape(-1, 3)
+        _BRIDGE_ARRAYS = ([r[0] for r in records], arr[:, 0].copy(), arr[:, 1].copy(), arr[:, 2].copy())
+    return _BRIDGE_ARRAYS
+
+
+def nearest_bridges_for_midpoints(mid_lats: np.ndarray, mid_lons: np.ndarray) -> List[Optional[str]]:
+    """
+    Versão em lote de `nearest_bridge_for_walk_edge`, a partir dos pontos médios
+    dos segmentos: ponte mais próxima de cada ponto, ou None fora do raio de snap.
+    """
+    ids, b_lats, b_lons, b_radius = _bridge_arrays()
+    if not ids:
+        return [None] * len(mid_lats)
+    dist = haversine_vec(mid_lats[:, None], mid_lons[:, None], b_lats[None, :], b_lons[None, :])
+    best = dist.argmin(axis=1)
+    within = dist[np.arange(len(best)), best] <= b_radius[best]
+    return [ids[b] if ok else None for b, ok in zip(best.tolist(), within.tolist())]
+
+
 def nearest_bridge_for_walk_edge(
     p1: tuple[float, float],
     p2: tuple[float, float],
@@ -241,9 +353,11 @@ def nearest_bridge_for_walk_edge(
     Se não houver nenhuma ponte suficientemente próxima, devolve None.
     """
     if bridges_geometry is None:
-        bridges_geometry = _load_bridges_geometry()
+        records = _default_bridge_records()
+    else:
+        records = _bridge_records(bridges_geometry)
 
-    if not bridges_geometry:
+    if not records:
         return None
 
     lat1, lon1 = p1
@@ -252,35 +366,35 @@ def nearest_bridge_for_walk_edge(
     mid_lon = 0.5 * (lon1 + lon2)
 
     best_id: Optional[str] = None
-    best_dist: Optional[float] = None
+    best_term: Optional[float] = None
+    best_lat = best_lon = 0.0
     best_radius: float = 0.0
 
-    for bridge in bridges_geometry:
-        try:
-            b_id = str(bridge.get("id") or "").strip()
-            b_lat = float(bridge.get("midpoint_lat"))
-            b_lon = float(bridge.get("midpoint_lon"))
-            snap_radius = float(bridge.get("snap_radius_m", 0.0))
-        except (TypeError, ValueError):
-            continue
-        if not b_id or snap_radius <= 0.0:
-            continue
-
-        d = haversine_m(mid_lat, mid_lon, b_lat, b_lon)
-        if best_dist is None or d < best_dist:
-            best_dist = d
+    for b_id, b_lat, b_lon, snap_radius in records:
+        # a distância é monótona no termo `a`: só a ponte escolhida precisa dela
+        term = _haversine_term(mid_lat, mid_lon, b_lat, b_lon)
+        if best_term is None or term < best_term:
+            best_term = term
             best_id = b_id
+            best_lat, best_lon = b_lat, b_lon
             best_radius = snap_radius
 
-    if best_dist is None or best_id is None:
+    if best_term is None or best_id is None:
         return None
 
-    if best_dist > best_radius:
+    if haversine_m(mid_lat, mid_lon, best_lat, best_lon) > best_radius:
         return None
 
     return best_id
 
 
+def _bridge_rules() -> Dict[str, bool]:
+    """Regras das pontes (`BRIDGE_RULES`), carregadas do ficheiro na primeira utilização."""
+    if not BRIDGE_RULES:
+        load_bridge_rules()
+    return BRIDGE_RULES
+
+
 def is_walk_edge_allowed(
     p1: tuple[float, float],
     p2: tuple[float, float],
@@ -293,12 +407,10 @@ def is_walk_edge_allowed(
     """
     if not crosses_douro(p1, p2):
         return True
-    if not BRIDGE_RULES:
-        load_bridge_rules()
     bridge_id = nearest_bridge_for_walk_edge(p1, p2)
     if bridge_id is None:
         return False
-    return bool(BRIDGE_RULES.get(bridge_id))
+    return bool(_bridge_rules().get(bridge_id))
 
 
 def add_direct_walk_edge(
@@ -344,10 +456,8 @@ def add_direct_walk_edge(
     bridge_attr = None
     # aplicar regras do Douro/pontes se atravessar a zona do rio
     if crosses_douro(p1, p2):
-        if not BRIDGE_RULES:
-            load_bridge_rules()
         bridge_id = nearest_bridge_for_walk_edge(p1, p2)
-        allowed = bool(bridge_id and BRIDGE_RULES.get(bridge_id))
+        allowed = bool(bridge_id and _bridge_rules().get(bridge_id))
         if not allowed:
             if hasattr(graph, "blocked_douro_walk_edges"):
                 graph.blocked_douro_walk_edges += 1
@@ -378,17 +488,42 @@ def add_direct_walk_edge(
     return True
 
 
+def _column_values(df: pd.DataFrame, column: str) -> list:
+    """Valores da coluna como lista Python (None por linha se não existir, como `row.get`)."""
+    if column in df.columns:
+        return df[column].tolist()
+    return [None] * len(df)
+
+
 def _fallback_speed(mode: str) -> float:
     if mode == "metro":
         return METRO_CRUISE_SPEED_KMH * 1000 / 3600
     return STCP_CRUISE_SPEED_KMH * 1000 / 3600
 
 
+def _strip_accents(value: str) -> str:
+    normalized = unicodedata.normalize("NFKD", value)
+    return "".join(ch for ch in normalized if not unicodedata.combining(ch))
+
+
+# Letras latinas acentuadas (Latin-1 e Latin Extended-A) que se reduzem a uma
+# letra ASCII; o resto cai no caminho NFKD completo.
+_ACCENT_TABLE = str.maketrans(
+    {
+        ch: base
+        for ch, base in ((chr(c), _strip_accents(chr(c))) for c in range(0xC0, 0x180))
+        if base != ch and len(base) == 1 and base.isascii()
+    }
+)
+
+
 def _normalize_text(value: str) -> str:
     if value is None:
         return ""
-    normalized = unicodedata.normalize("NFKD", str(value))
-    return "".join(ch for ch in normalized if not unicodedata.combining(ch)).lower()
+    text = str(value).translate(_ACCENT_TABLE)
+    if not text.isascii():
+        text = _strip_accents(text)
+    return text.lower()
 
 
 class MultimodalGraph:
@@ -415,6 +550,27 @@ class MultimodalGraph:
         self._build_edges()
         self._compute_route_headways()
 
+    def __getstate__(self):
+        """
+        Estado serializado na cache do grafo (`graph_cache.pkl`).
+
+        As tabelas GTFS brutas (`stop_times`, `shapes`, ...) só são usadas durante
+        a construção e representam quase todo o volume do pickle; não são
+        persistidas, ficando apenas `prefix` e `paths` de cada rede.
+        """
+        state = self.__dict__.copy()
+        state.pop("_transit_stops", None)  # reconstruído a partir de `G`
+        state.pop("_fare_rules_cache", None)  # reconstruída a partir de `fare_rules`
+        state.pop("_fare_zone_count", None)  # reconstruído a partir de `fare_attributes`
+        state.pop("_stop_names", None)  # reconstruído a partir de `G`
+        state.pop("_degree", None)  # reconstruído a partir de `G`
+        state.pop("_succ_lists", None)  # reconstruído a partir de `G`
+        for key in ("metro", "stcp"):
+            system = state.get(key) or {}
+            state[key] = {k: v for k, v in system.items() if not isinstance(v, pd.DataFrame)}
+        state["networks"] = {"metro": state["metro"], "stcp": state["stcp"]}
+        return state
+
     # ---------------------- construção do grafo ---------------------- #
 
     def _ensure_state_compatibility(self):
@@ -439,9 +595,10 @@ class MultimodalGraph:
         df["stop_name"] = df["stop_name"].fillna("").astype(str)
         if "zone_id" not in df.columns:
             df["zone_id"] = None
-        df["node_id"] = df.apply(lambda r: f"{prefix}_{r['stop_id']}", axis=1)
-        for _, row in df.iterrows():
-            self.node_lookup[(mode, row["stop_id"])] = row["node_id"]
+        df["node_id"] = prefix + "_" + df["stop_id"]
+        self.node_lookup.update(
+            ((mode, stop_id), node_id) for stop_id, node_id in zip(df["stop_id"].tolist(), df["node_id"].tolist())
+        )
         return df[["node_id", "stop_id", "stop_name", "mode", "prefix", "zone_id", "stop_lat", "stop_lon"]]
 
     def _build_nodes(self):
@@ -452,17 +609,31 @@ class MultimodalGraph:
             self.stops = pd.concat(frames, ignore_index=True)
         else:
             self.stops = pd.DataFrame(columns=["node_id", "stop_id", "mode", "prefix", "zone_id", "stop_lat", "stop_lon"])
-        for _, row in self.stops.iterrows():
-            self.G.add_node(
-                row["node_id"],
-                lat=float(row["stop_lat"]),
-                lon=float(row["stop_lon"]),
-                mode=row["mode"],
-                zone_id=row.get("zone_id"),
-                stop_id=row["stop_id"],
-                prefix=row["prefix"],
-                stop_name=row.get("stop_name"),
+        stops = self.stops
+        self.G.add_nodes_from(
+            (
+                node_id,
+                {
+                    "lat": float(lat),
+                    "lon": float(lon),
+                    "mode": mode,
+                    "zone_id": zone_id,
+                    "stop_id": stop_id,
+                    "prefix": prefix,
+                    "stop_name": stop_name,
+                },
             )
+            for node_id, lat, lon, mode, zone_id, stop_id, prefix, stop_name in zip(
+                stops["node_id"].tolist(),
+                stops["stop_lat"].tolist(),
+                stops["stop_lon"].tolist(),
+                stops["mode"].tolist(),
+                _column_values(stops, "zone_id"),
+                stops["stop_id"].tolist(),
+                stops["prefix"].tolist(),
+                _column_values(stops, "stop_name"),
+            )
+        )
 
     def _build_edges(self):
         for mode, system in self.networks.items():
@@ -482,55 +653,90 @@ class MultimodalGraph:
         trip_info = trips[merge_cols].copy()
         merged = stop_times.merge(trip_info, on="trip_id", how="left")
         merged = merged.sort_values(by=["trip_id", "stop_sequence"])
-        prev = None
-        for _, row in merged.iterrows():
-            if prev is not None and prev["trip_id"] == row["trip_id"]:
-                u = self.node_lookup.get((mode, str(prev["stop_id"])))
-                v = self.node_lookup.get((mode, str(row["stop_id"])))
-                if not u or not v or u == v or u not in self.G or v not in self.G:
-                    prev = row
-                    continue
-                lat1, lon1 = self.G.nodes[u]["lat"], self.G.nodes[u]["lon"]
-                lat2, lon2 = self.G.nodes[v]["lat"], self.G.nodes[v]["lon"]
-                dist = haversine(lat1, lon1, lat2, lon2)
-                time_s = self._edge_time_seconds(prev, row, dist, mode)
-                route_id = row.get("route_id")
-                attrs = {
+        merged["arr_s"] = to_seconds_series(merged["arrival_time"])
+        merged["dep_s"] = to_seconds_series(merged["departure_time"])
+        # Cada aresta liga paragens consecutivas da mesma viagem; máscara,
+        # distâncias e tempos calculados por coluna.
+        mode_lookup = {stop_id: node_id for (m, stop_id), node_id in self.node_lookup.items() if m == mode}
+        node_col = merged["stop_id"].astype(str).map(mode_lookup)
+        node_lat = {n: d["lat"] for n, d in self.G.nodes(data=True)}
+        node_lon = {n: d["lon"] for n, d in self.G.nodes(data=True)}
+        in_graph = node_col.isin(node_lat.keys()).to_numpy()
+        nodes = node_col.to_numpy(dtype=object)
+        trip_ids = merged["trip_id"].to_numpy(dtype=object)
+        valid = (
+            (trip_ids[1:] == trip_ids[:-1])
+            & in_graph[:-1]
+            & in_graph[1:]
+            & (nodes[1:] != nodes[:-1])
+        )
+        idx = np.flatnonzero(valid)
+        if not len(idx):
+            return
+        nxt = idx + 1
+
+        lats = node_col.map(node_lat).to_numpy(dtype=np.float64)
+        lons = node_col.map(node_lon).to_numpy(dtype=np.float64)
+        dist = haversine_vec(lats[idx], lons[idx], lats[nxt], lons[nxt])
+        # NaN (horas inválidas) falha a comparação e cai para a velocidade de cruzeiro.
+        candidate = merged["arr_s"].to_numpy(dtype=np.float64)[nxt] - merged["dep_s"].to_numpy(dtype=np.float64)[idx]
+        with np.errstate(invalid="ignore"):
+            positive = candidate > 0
+        time_s = np.where(positive, candidate, np.maximum(dist / _fallback_speed(mode), 1.0))
+
+        edges = pd.DataFrame(
+            {
+                "u": nodes[idx],
+                "v": nodes[nxt],
+                "distance_m": dist,
+                "time_s": time_s,
+                "route_id": np.asarray(_column_values(merged, "route_id"), dtype=object)[nxt],
+                "trip_id": trip_ids[nxt],
+            }
+        )
+        # O mesmo par (u, v) repete-se em muitas viagens: o DiGraph guarda-o na
+        # posição da primeira inserção e com os atributos da última.
+        edges["pair"] = edges.groupby(["u", "v"], sort=False).ngroup()
+        edges = edges.drop_duplicates("pair", keep="last").sort_values("pair")
+
+        operator = system.get("prefix", mode.upper())
+        self.G.add_edges_from(
+            (
+                u,
+                v,
+                {
                     "mode": mode,
-                    "operator": system.get("prefix", mode.upper()),
+                    "operator": operator,
                     "transit": True,
-                    "distance_m": dist,
-                    "time_s": time_s,
-                    "time": time_s,
+                    "distance_m": dist_m,
+                    "time_s": time_val,
+                    "time": time_val,
                     "route_id": None if pd.isna(route_id) else str(route_id),
-                    "trip_id": str(row["trip_id"]),
-                }
-                self.G.add_edge(u, v, **attrs)
-            prev = row
-
-    def _edge_time_seconds(self, prev_row, curr_row, dist_m: float, mode: str) -> float:
-        time_s: Optional[float] = None
-        try:
-            arr = to_seconds(str(curr_row["arrival_time"]))
-            dep = to_seconds(str(prev_row["departure_time"]))
-            candidate = arr - dep
-            if candidate > 0:
-                time_s = float(candidate)
-        except Exception:
-            time_s = None
-        if time_s is None:
-            speed = _fallback_speed(mode)
-            time_s = max(dist_m / speed, 1.0)
-        return float(time_s)
+                    "trip_id": str(trip_id),
+                },
+            )
+            for u, v, dist_m, time_val, route_id, trip_id in zip(
+                edges["u"].tolist(),
+                edges["v"].tolist(),
+                edges["distance_m"].tolist(),
+                edges["time_s"].tolist(),
+                edges["route_id"].tolist(),
+                edges["trip_id"].tolist(),
+            )
+        )
 
     def _add_transfer_edges(self, system: dict, mode: str):
         transfers = system.get("transfers")
         if transfers is None or transfers.empty:
             return
 
-        for _, row in transfers.iterrows():
-            from_stop = row.get("from_stop_id")
-            to_stop = row.get("to_stop_id")
+        new_edges = []
+        for from_stop, to_stop, transfer_type, min_transfer_time in zip(
+            _column_values(transfers, "from_stop_id"),
+            _column_values(transfers, "to_stop_id"),
+            _column_values(transfers, "transfer_type"),
+            _column_values(transfers, "min_transfer_time"),
+        ):
             if pd.isna(from_stop) or pd.isna(to_stop):
                 continue
 
@@ -539,7 +745,6 @@ class MultimodalGraph:
             if not from_id or not to_id or from_id not in self.G or to_id not in self.G:
                 continue
 
-            transfer_type = row.get("transfer_type")
             try:
                 transfer_type_int = int(transfer_type) if not pd.isna(transfer_type) else None
             except (TypeError, ValueError):
@@ -549,13 +754,11 @@ class MultimodalGraph:
             if transfer_type_int == 3:
                 continue
 
-            transfer_time = 0.0
-            if "min_transfer_time" in transfers.columns:
-                val = row.get("min_transfer_time")
-                try:
-                    transfer_time = float(val) if not pd.isna(val) else 0.0
-                except (TypeError, ValueError):
-                    transfer_time = 0.0
+            # sem coluna `min_transfer_time` os valores são None → 0.0
+            try:
+                transfer_time = float(min_transfer_time) if not pd.isna(min_transfer_time) else 0.0
+            except (TypeError, ValueError):
+                transfer_time = 0.0
 
             attrs = {
                 "mode": "transfer",
@@ -567,20 +770,26 @@ class MultimodalGraph:
                 "trip_id": None,
                 "transfer_type": transfer_type_int,
             }
-            self.G.add_edge(from_id, to_id, **attrs)
+            new_edges.append((from_id, to_id, attrs))
+        self.G.add_edges_from(new_edges)
 
     def _walk_cell_index(self):
         """
         Constrói um índice espacial em grelha para as paragens de modo a
         limitar a procura de vizinhos a células próximas.
+
+        Devolve os ids e coordenadas das paragens em arrays, a sua projeção
+        equiretangular em metros e, por célula, o array de índices das
+        paragens que lá caem.
         """
-        stops_list = self.stops[["node_id", "stop_lat", "stop_lon"]].values.tolist()
-        if not stops_list:
-            return {}, 0.0, 0.0
+        node_ids = self.stops["node_id"].to_numpy(dtype=object)
+        lats = self.stops["stop_lat"].to_numpy(dtype=np.float64)
+        lons = self.stops["stop_lon"].to_numpy(dtype=np.float64)
+        if not len(node_ids):
+            return {}, node_ids, lats, lons, lons, lats
 
         # Aproximação: 1 grau de latitude ~ 111 km
-        lats = [float(lat) for _, lat, _ in stops_list]
-        ref_lat = sum(lats) / len(lats)
+        ref_lat = float(lats.mean())
         meters_per_deg_lat = 111_000.0
         cos_lat = math.cos(math.radians(ref_lat))
         if abs(cos_lat) < 1e-6:
@@ -590,93 +799,135 @@ class MultimodalGraph:
         cell_size_deg_lat = self.walk_radius / meters_per_deg_lat
         cell_size_deg_lon = self.walk_radius / meters_per_deg_lon
 
-        grid: Dict[Tuple[int, int], List[Tuple[str, float, float]]] = {}
-        for node_id, lat, lon in stops_list:
-            lat_f = float(lat)
-            lon_f = float(lon)
-            cy = int(math.floor(lat_f / cell_size_deg_lat))
-            cx = int(math.floor(lon_f / cell_size_deg_lon))
-            grid.setdefault((cx, cy), []).append((node_id, lat_f, lon_f))
-
-        return grid, cell_size_deg_lat, cell_size_deg_lon
+        cys = np.floor(lats / cell_size_deg_lat).astype(np.int64).tolist()
+        cxs = np.floor(lons / cell_size_deg_lon).astype(np.int64).tolist()
+        cells: Dict[Tuple[int, int], List[int]] = {}
+        for i, cell in enumerate(zip(cxs, cys)):
+            cells.setdefault(cell, []).append(i)
+        grid = {cell: np.asarray(idx, dtype=np.int64) for cell, idx in cells.items()}
+        xs = (lons - lons.mean()) * meters_per_deg_lon
+        ys = (lats - ref_lat) * meters_per_deg_lat
+        return grid, node_ids, lats, lons, xs, ys
 
     def _add_walking_edges(self):
-        grid, _, _ = self._walk_cell_index()
+        grid, node_ids, lats, lons, xs, ys = self._walk_cell_index()
         if not grid:
             return
 
-        seen_pairs: set[Tuple[str, str]] = set()
-
-        for (cx, cy), items in grid.items():
-            for node_id, lat, lon in items:
-                for nx_cell in (cx - 1, cx, cx + 1):
-                    for ny_cell in (cy - 1, cy, cy + 1):
-                        for other_id, other_lat, other_lon in grid.get((nx_cell, ny_cell), []):
-                            if other_id == node_id:
-                                continue
-                            pair = (node_id, other_id) if node_id < other_id else (other_id, node_id)
-                            if pair in seen_pairs:
-                                continue
-                            seen_pairs.add(pair)
-
-                            d = haversine(lat, lon, other_lat, other_lon)
-                            if d <= self.walk_radius:
-                                p1 = (float(lat), float(lon))
-                                p2 = (float(other_lat), float(other_lon))
-
-                                # Classifica travessias do Douro e conta bloqueios.
-                                if crosses_douro(p1, p2):
-                                    if not BRIDGE_RULES:
-                                        load_bridge_rules()
-                                    bridge_id = nearest_bridge_for_walk_edge(p1, p2)
-                                    allowed = bool(bridge_id and BRIDGE_RULES.get(bridge_id))
-                                    if not allowed:
-                                        self.blocked_douro_walk_edges += 1
-                                        continue
-                                    bridge_attr = bridge_id
-                                else:
-                                    allowed = True
-                                    bridge_attr = None
-
-                                if not allowed:
-                                    continue
-
-                                walk_time = d / WALK_SPEED_M_S
-                                attrs_forward = {
-                                    "mode": "walk",
-                                    "transit": False,
-                                    "time_s": walk_time,
-                                    "time": walk_time,
-                                    "distance_m": d,
-                                }
-                                if bridge_attr is not None:
-                                    attrs_forward["bridge_id"] = bridge_attr
-                                attrs_backward = attrs_forward.copy()
-                                u, v = pair
-                                if not self.G.has_edge(u, v) or not self.G[u][v].get("transit", False):
-                                    self.G.add_edge(u, v, **attrs_forward)
-                                if not self.G.has_edge(v, u) or not self.G[v][u].get("transit", False):
-                                    self.G.add_edge(v, u, **attrs_backward)
+        # Pré-filtro euclidiano no plano projetado; a margem cobre o erro da
+        # projeção na área metropolitana, o Haversine decide a fronteira.
+        prefilter_sq = (self.walk_radius * WALK_PREFILTER_MARGIN) ** 2
+
+        # ordem em que cada paragem é percorrida (célula a célula)
+        rank = np.empty(len(node_ids), dtype=np.int64)
+        rank[np.concatenate(list(grid.values()))] = np.arange(len(node_ids))
+
+        # 1) pares dentro do raio, célula a célula
+        empty = np.empty(0, dtype=np.int64)
+        src_parts, dst_parts, dist_parts = [], [], []
+        for (cx, cy), cell_idx in grid.items():
+            # Vizinhança 3x3 da célula; distâncias de todas as paragens da
+            # célula a todos os candidatos de uma só vez.
+            cand = np.concatenate(
+                [
+                    grid.get((nx_cell, ny_cell), empty)
+                    for nx_cell in (cx - 1, cx, cx + 1)
+                    for ny_cell in (cy - 1, cy, cy + 1)
+                ]
+            )
+            dx = xs[cand][None, :] - xs[cell_idx, None]
+            dy = ys[cand][None, :] - ys[cell_idx, None]
+            # Cada par é visto a partir de ambas as paragens (vizinhança
+            # simétrica): trata-se só a partir da que aparece primeiro.
+            keep = (rank[cand][None, :] > rank[cell_idx][:, None]) & (dx * dx + dy * dy <= prefilter_sq)
+            rows, cols = np.nonzero(keep)
+            s_idx, d_idx = cell_idx[rows], cand[cols]
+            dist = haversine_vec(lats[s_idx], lons[s_idx], lats[d_idx], lons[d_idx])
+            within = dist <= self.walk_radius
+            src_parts.append(s_idx[within])
+            dst_parts.append(d_idx[within])
+            dist_parts.append(dist[within])
+        src = np.concatenate(src_parts)
+        dst = np.concatenate(dst_parts)
+        dists = np.concatenate(dist_parts)
+
+        # 2) travessias do Douro e ponte mais próxima, para todos os pares de uma vez
+        crossing = douro_crossing_mask(lats[src], lons[src], lats[dst], lons[dst])
+        bridge_ids: List[Optional[str]] = [None] * len(src)
+        crossing_idx = np.flatnonzero(crossing)
+        if len(crossing_idx):
+            s_idx, d_idx = src[crossing_idx], dst[crossing_idx]
+            nearest = nearest_bridges_for_midpoints(
+                0.5 * (lats[s_idx] + lats[d_idx]),
+                0.5 * (lons[s_idx] + lons[d_idx]),
+            )
+            for k, bridge_id in zip(crossing_idx.tolist(), nearest):
+                bridge_ids[k] = bridge_id
+
+        # 3) arestas (a pé nunca substitui uma aresta de trânsito já existente)
+        rules = _bridge_rules()
+        transit_edges = {(u, v) for u, v, transit in self.G.edges(data="transit", default=False) if transit}
+        new_edges = []
+        for i, j, d, crosses, bridge_attr in zip(
+            src.tolist(), dst.tolist(), dists.tolist(), crossing.tolist(), bridge_ids
+        ):
+            # Bloqueia travessias sem ponte permitida e conta-as.
+            if crosses and not (bridge_attr and rules.get(bridge_attr)):
+                self.blocked_douro_walk_edges += 1
+                continue
+
+            walk_time = d / WALK_SPEED_M_S
+            # `add_edges_from` copia os atributos: o mesmo dicionário serve aos dois sentidos
+            attrs = {
+                "mode": "walk",
+                "transit": False,
+                "time_s": walk_time,
+                "time": walk_time,
+                "distance_m": d,
+            }
+            if bridge_attr is not None:
+                attrs["bridge_id"] = bridge_attr
+            node_id, other_id = node_ids[i], node_ids[j]
+            u, v = (node_id, other_id) if node_id < other_id else (other_id, node_id)
+            if (u, v) not in transit_edges:
+                new_edges.append((u, v, attrs))
+            if (v, u) not in transit_edges:
+                new_edges.append((v, u, attrs))
+        self.G.add_edges_from(new_edges)
 
     # ---------------------- headways e tarifas ---------------------- #
 
-    def nearest_stops(self, lat: float, lon: float, radius_m: float = 600.0, k: int = 8):
-        candidates = []
-        for node_id, attrs in self.G.nodes(data=True):
-            if attrs.get("mode") in ("metro", "stcp"):
-                dist = haversine(lat, lon, float(attrs.get("lat")), float(attrs.get("lon")))
-                if radius_m is None or dist <= radius_m:
-                    candidates.append((node_id, dist))
-        if not candidates and radius_m is not None:
-            # fallback sem raio para garantir k resultados
+    def _transit_stop_arrays(self):
+        """Ids e coordenadas das paragens metro/STCP, pela ordem dos nós do grafo."""
+        cached = getattr(self, "_transit_stops", None)
+        if cached is None:
+            ids, lats, lons = [], [], []
             for node_id, attrs in self.G.nodes(data=True):
                 if attrs.get("mode") in ("metro", "stcp"):
-                    dist = haversine(lat, lon, float(attrs.get("lat")), float(attrs.get("lon")))
-                    candidates.append((node_id, dist))
-        candidates.sort(key=lambda x: x[1])
+                    ids.append(node_id)
+                    lats.append(float(attrs.get("lat")))
+                    lons.append(float(attrs.get("lon")))
+            cached = self._transit_stops = (
+                ids,
+                np.asarray(lats, dtype=np.float64),
+                np.asarray(lons, dtype=np.float64),
+            )
+        return cached
+
+    def nearest_stops(self, lat: float, lon: float, radius_m: float = 600.0, k: int = 8):
+        ids, lats, lons = self._transit_stop_arrays()
+        dist = haversine_vec(float(lat), float(lon), lats, lons)
+        idx = np.arange(len(ids))
+        if radius_m is not None:
+            within = idx[dist <= radius_m]
+            # fallback sem raio para garantir k resultados
+            if len(within):
+                idx = within
+        # ordenação estável: empates mantêm a ordem dos nós
+        idx = idx[np.argsort(dist[idx], kind="stable")]
         if k is not None and k > 0:
-            candidates = candidates[:k]
-        return candidates
+            idx = idx[:k]
+        return [(ids[i], dist[i].item()) for i in idx.tolist()]
 
     def add_virtual_point(
         self,
@@ -718,10 +969,8 @@ class MultimodalGraph:
 
             bridge_attr = None
             if crosses_douro(p1, p2):
-                if not BRIDGE_RULES:
-                    load_bridge_rules()
                 bridge_id = nearest_bridge_for_walk_edge(p1, p2)
-                allowed = bool(bridge_id and BRIDGE_RULES.get(bridge_id))
+                allowed = bool(bridge_id and _bridge_rules().get(bridge_id))
                 if not allowed:
                     self.blocked_douro_walk_edges += 1
                     continue
@@ -767,13 +1016,7 @@ class MultimodalGraph:
         if "departure_time" not in first_stops.columns:
             return {}
 
-        def _safe_seconds(value):
-            try:
-                return to_seconds(value)
-            except Exception:
-                return None
-
-        first_stops["dep_s"] = first_stops["departure_time"].map(_safe_seconds)
+        first_stops["dep_s"] = to_seconds_series(first_stops["departure_time"])
         first_stops = first_stops.dropna(subset=["dep_s"])
         if first_stops.empty:
             return {}
@@ -849,15 +1092,29 @@ class MultimodalGraph:
     def shortest_path_between(self, start, end, weight="time_s"):
         return nx.shortest_path(self.G, start, end, weight=weight)
 
+    def shortest_paths_from(self, start, weight="time_s") -> Dict[str, List[str]]:
+        """Caminhos mais curtos de `start` para todos os nós alcançáveis."""
+        return nx.single_source_dijkstra_path(self.G, start, weight=weight)
+
+    def _successor_lists(self) -> Dict[str, List[str]]:
+        """Sucessores de cada nó em lista, recalculados só quando o grafo muda de tamanho."""
+        key = (self.G.number_of_nodes(), self.G.number_of_edges())
+        cached = getattr(self, "_succ_lists", None)
+        if cached is None or cached[0] != key:
+            cached = (key, {node: list(nbrs) for node, nbrs in self.G.succ.items()})
+            self._succ_lists = cached
+        return cached[1]
+
     def random_walk(self, start, end, max_steps=100):
         import random
 
+        successors = self._successor_lists()
         path = [start]
         current = start
         for _ in range(max_steps):
             if current == end:
                 break
-            neighbors = list(self.G.successors(current))
+            neighbors = successors.get(current)
             if not neighbors:
                 break
             current = random.choice(neighbors)
@@ -866,6 +1123,32 @@ class MultimodalGraph:
             return None
         return path
 
+    def _stop_name_index(self) -> List[Tuple[str, str, str, str, Optional[str]]]:
+        """
+        Nomes das paragens já preparados para a pesquisa:
+        `(node_id, nome, nome em minúsculas, nome normalizado, modo)`.
+        """
+        cached = getattr(self, "_stop_names", None)
+        if cached is None or cached[0] != self.G.number_of_nodes():
+            entries = []
+            for node_id, data in self.G.nodes(data=True):
+                name = data.get("stop_name")
+                if not name:
+                    continue
+                entries.append((node_id, name, str(name).lower(), _normalize_text(name), data.get("mode")))
+            cached = (self.G.number_of_nodes(), entries)
+            self._stop_names = cached
+        return cached[1]
+
+    def _degree_snapshot(self) -> Dict[str, int]:
+        """Grau de cada nó, recalculado só quando o grafo muda de tamanho."""
+        key = (self.G.number_of_nodes(), self.G.number_of_edges())
+        cached = getattr(self, "_degree", None)
+        if cached is None or cached[0] != key:
+            cached = (key, dict(self.G.degree()))
+            self._degree = cached
+        return cached[1]
+
     def search_stops_by_name(self, query: str, max_results: Optional[int] = None):
         """
         Procura paragens cujo nome corresponda (total ou parcialmente) a `query`.
@@ -877,27 +1160,29 @@ class MultimodalGraph:
             return []
         q = str(query).strip().lower()
         q_norm = _normalize_text(query)
+        # `q_norm` fica como seq2: o SequenceMatcher só o indexa uma vez
+        matcher = difflib.SequenceMatcher(None, "", q_norm)
+        degrees = self._degree_snapshot()
         results: List[dict] = []
-        for node_id, data in self.G.nodes(data=True):
-            name = data.get("stop_name")
-            if not name:
-                continue
-            lowered = str(name).lower()
-            normalized = _normalize_text(name)
+        for node_id, name, lowered, normalized, mode in self._stop_name_index():
             if lowered == q or (q_norm and normalized == q_norm):
                 match_type = 0
             elif (q and q in lowered) or (q_norm and q_norm in normalized):
                 match_type = 1
             elif q_norm:
-                ratio = difflib.SequenceMatcher(None, normalized, q_norm).ratio()
-                if ratio < 0.6:
+                matcher.set_seq1(normalized)
+                # limites superiores baratos de `ratio()` antes do cálculo exacto
+                if (
+                    matcher.real_quick_ratio() < 0.6
+                    or matcher.quick_ratio() < 0.6
+                    or matcher.ratio() < 0.6
+                ):
                     continue
                 match_type = 2
             else:
                 continue
-            mode = data.get("mode")
             mode_priority = {"metro": 0, "stcp": 1}.get(mode, 2)
-            degree = self.G.degree(node_id)
+            degree = degrees.get(node_id, 0)
             results.append(
                 {
                     "node_id": node_id,
@@ -921,7 +1206,13 @@ class MultimodalGraph:
             return results[:max_results]
         return results
 
-    def path_metrics(self, path: Iterable[str]):
+    def path_metrics(self, path: Iterable[str], include_segments: bool = True):
+        """
+        Métricas agregadas de um caminho (tempo, esperas, emissões, tarifa, ...).
+
+        Com `include_segments=False` não se constrói a lista de segmentos
+        (devolvida vazia): basta para avaliar fitness.
+        """
         self._ensure_state_compatibility()
         from collections import defaultdict
 
@@ -929,6 +1220,7 @@ class MultimodalGraph:
         waiting_time = 0.0
         total_emissions = 0.0
         walking_distance = 0.0
+        walking_time = 0.0
         waits_by_route = defaultdict(float)
         distance_km_by_mode = defaultdict(float)
         routes_used: set[Tuple[str, str]] = set()
@@ -944,21 +1236,26 @@ class MultimodalGraph:
         transfers = 0
         last_was_transfer = False
 
-        nodes = remove_cycles(list(path))
+        nodes = remove_cycles(path)
         if not nodes:
             return self._penalised_metrics()
 
-        origin_zone = self.G.nodes[nodes[0]].get("zone_id") if nodes[0] in self.G else None
-        dest_zone = self.G.nodes[nodes[-1]].get("zone_id") if nodes[-1] in self.G else None
+        # Vistas do próprio DiGraph ligadas uma vez a locais: acompanham
+        # mutações do grafo (pontos virtuais) e evitam has_edge + G[u][v].
+        node_attrs = self.G.nodes
+        succ = self.G.succ
 
         for node in nodes:
-            if node not in self.G:
+            if node not in node_attrs:
                 return self._penalised_metrics()
 
+        origin_zone = node_attrs[nodes[0]].get("zone_id")
+        dest_zone = node_attrs[nodes[-1]].get("zone_id")
+
         for u, v in zip(nodes[:-1], nodes[1:]):
-            if not self.G.has_edge(u, v):
+            data = succ[u].get(v)
+            if data is None:
                 return self._penalised_metrics()
-            data = self.G[u][v]
             mode = data.get("mode", "unknown")
             transit = data.get("transit", False)
             distance_m = float(data.get("distance_m", 0.0))
@@ -981,17 +1278,18 @@ class MultimodalGraph:
                     wait_s = 0.5 * headway
                     route_wait_key = route_id_str or "unknown"
                     waits_by_route[route_wait_key] += wait_s
-                    segments.append(
-                        {
-                            "from_stop": u,
-                            "to_stop": u,
-                            "mode": "wait",
-                            "route_id": route_id,
-                            "time_s": wait_s,
-                            "distance_m": 0.0,
-                            "transit": False,
-                        }
-                    )
+                    if include_segments:
+                        segments.append(
+                            {
+                                "from_stop": u,
+                                "to_stop": u,
+                                "mode": "wait",
+                                "route_id": route_id,
+                                "time_s": wait_s,
+                                "distance_m": 0.0,
+                                "transit": False,
+                            }
+                        )
                     waiting_time += wait_s
                 if not last_was_transfer and prev_transit_route is not None and route_key != prev_transit_route:
                     transfers += 1
@@ -999,16 +1297,18 @@ class MultimodalGraph:
                 last_was_transfer = False
 
             total_travel_time += time_s
-            segment = {
-                "from_stop": u,
-                "to_stop": v,
-                "mode": mode,
-                "route_id": route_id,
-                "time_s": time_s,
-                "distance_m": distance_m,
-                "transit": transit,
-            }
-            segments.append(segment)
+            if include_segments:
+                segments.append(
+                    {
+                        "from_stop": u,
+                        "to_stop": v,
+                        "mode": mode,
+                        "route_id": route_id,
+                        "time_s": time_s,
+                        "distance_m": distance_m,
+                        "transit": transit,
+                    }
+                )
 
             if transit:
                 routes_used.add(route_key)
@@ -1017,13 +1317,14 @@ class MultimodalGraph:
                 distance_km_by_mode[mode] += distance_m / 1000.0
                 prev_transit_route = route_key
 
-                zone_u = self.G.nodes[u].get("zone_id")
-                zone_v = self.G.nodes[v].get("zone_id")
+                zone_u = node_attrs[u].get("zone_id")
+                zone_v = node_attrs[v].get("zone_id")
                 _push_zone(zone_u)
                 _push_zone(zone_v)
             else:
                 if mode == "walk":
                     walking_distance += distance_m
+                    walking_time += time_s
                     distance_km_by_mode[mode] += distance_m / 1000.0
                 elif mode == "transfer":
                     transfers += 1
@@ -1032,10 +1333,8 @@ class MultimodalGraph:
                     distance_km_by_mode[mode] += distance_m / 1000.0
                 prev_block = None
 
-        # Determinar se houve ou não qualquer segmento de trânsito no caminho.
-        has_transit = any(isinstance(seg, dict) and seg.get("transit") for seg in segments)
-
-        if not has_transit:
+        # Houve segmentos de trânsito sse alguma rota foi usada.
+        if not routes_used:
             # Percurso 100% walk/transfer → não há tarifa de transporte aplicada.
             fare_cost = 0.0
             fare_selected = None
@@ -1054,6 +1353,7 @@ class MultimodalGraph:
             "wait_s_total": waiting_time,
             "emissions_g": total_emissions,
             "walk_m": walking_distance,
+            "walk_time_s": walking_time,
             "fare_cost": fare_cost,
             "fare_selected": fare_selected,
             "n_transfers": transfers,
@@ -1073,6 +1373,7 @@ class MultimodalGraph:
             "wait_s_total": PENALTY,
             "emissions_g": PENALTY,
             "walk_m": PENALTY,
+            "walk_time_s": PENALTY,
             "fare_cost": PENALTY,
             "fare_selected": None,
             "n_transfers": PENALTY,
@@ -1082,6 +1383,34 @@ class MultimodalGraph:
             "distance_km_by_mode": {},
         }
 
+    def _fare_rule_columns(self) -> Dict[str, Tuple[np.ndarray, pd.Series]]:
+        """
+        Colunas de `fare_rules` usadas na filtragem de tarifas, já convertidas
+        para texto: por coluna, a máscara de valores em falta e os valores.
+        """
+        cached = getattr(self, "_fare_rules_cache", None)
+        if cached is None:
+            cached = {}
+            for column in ("fare_id", "route_id", "origin_id", "destination_id", "contains_id"):
+                if column in self.fare_rules.columns:
+                    values = self.fare_rules[column]
+                else:
+                    values = pd.Series([None] * len(self.fare_rules), dtype=object)
+                missing = values.isna().to_numpy()
+                cached[column] = (missing, values.astype(object).map(str).reset_index(drop=True))
+            self._fare_rules_cache = cached
+        return cached
+
+    def _fare_zone_counts(self) -> np.ndarray:
+        """Número de zonas indicado no `fare_id` de cada tarifa (0 se não tiver)."""
+        cached = getattr(self, "_fare_zone_count", None)
+        if cached is None or len(cached) != len(self.fare_attributes):
+            fare_ids = self.fare_attributes.get("fare_id", pd.Series([None] * len(self.fare_attributes)))
+            digits = fare_ids.astype(object).map(str).str.extract(r"(\d+)", expand=False)
+            cached = digits.map(int, na_action="ignore").fillna(0).to_numpy(dtype=np.int64)
+            self._fare_zone_count = cached
+        return cached
+
     def _estimate_fare(
         self,
         zones_passed: List[str],
@@ -1097,24 +1426,21 @@ class MultimodalGraph:
         routes_plain = {route_id for _, route_id in routes_used if route_id}
 
         if not self.fare_rules.empty:
-            for _, rule in self.fare_rules.iterrows():
-                fare_id = rule.get("fare_id")
-                if pd.isna(fare_id):
-                    continue
-                route_id = rule.get("route_id")
-                origin_id = rule.get("origin_id")
-                destination_id = rule.get("destination_id")
-                contains_id = rule.get("contains_id")
-
-                if pd.notna(route_id) and routes_plain and str(route_id) not in routes_plain:
-                    continue
-                if pd.notna(origin_id) and origin_zone and str(origin_zone) != str(origin_id):
-                    continue
-                if pd.notna(destination_id) and dest_zone and str(dest_zone) != str(destination_id):
-                    continue
-                if pd.notna(contains_id) and str(contains_id) not in zones_set:
-                    continue
-                candidate_ids.add(str(fare_id))
+            rule_cols = self._fare_rule_columns()
+            fare_missing, fare_ids = rule_cols["fare_id"]
+            mask = ~fare_missing
+            if routes_plain:
+                missing, values = rule_cols["route_id"]
+                mask &= missing | values.isin(routes_plain).to_numpy()
+            if origin_zone:
+                missing, values = rule_cols["origin_id"]
+                mask &= missing | (values == str(origin_zone)).to_numpy()
+            if dest_zone:
+                missing, values = rule_cols["destination_id"]
+                mask &= missing | (values == str(dest_zone)).to_numpy()
+            missing, values = rule_cols["contains_id"]
+            mask &= missing | values.isin(zones_set).to_numpy()
+            candidate_ids = set(fare_ids[mask].tolist())
 
         if not candidate_ids:
             candidate_ids = set(self.fare_attributes.get("fare_id", []))
@@ -1122,22 +1448,11 @@ class MultimodalGraph:
         fares = self.fare_attributes[self.fare_attributes["fare_id"].isin(candidate_ids)]
         if fares.empty:
             zone_count = max(1, len(zones_set) if zones_set else 1)
-            best_price: Optional[float] = None
-            for _, row in self.fare_attributes.iterrows():
-                fare_id = str(row.get("fare_id"))
-                match = re.search(r"(\d+)", fare_id)
-                if not match:
-                    continue
-                try:
-                    covered_zones = int(match.group(1))
-                except ValueError:
-                    continue
-                if covered_zones >= zone_count:
-                    price = row.get("price")
-                    if pd.notna(price):
-                        best_price = price if best_price is None else min(best_price, price)
-            if best_price is None:
+            covering = self._fare_zone_counts() >= zone_count
+            prices = self.fare_attributes["price"][covering].dropna() if "price" in self.fare_attributes else ()
+            if not len(prices):
                 return 0.0, None
+            best_price = prices.min()
             return float(best_price), {
                 "fare_id": None,
                 "price": float(best_price),
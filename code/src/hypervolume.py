@@ -23,12 +23,10 @@ def hypervolume_2d_min(points: Iterable[Point], ref: Point) -> float:
     `ref` deve ser pior (maior) do que todos os pontos.
     """
     rx, ry = float(ref[0]), float(ref[1])
-    front = pareto_filter_2d_min(points)
+    front = pareto_filter_2d_min(points)  # já vem por tempo ascendente
     if not front:
         return 0.0
 
-    front.sort(key=lambda p: p[0])  # tempo ascendente
-
     hv = 0.0
     prev_y = ry
     for x, y in front:
@@ -4,12 +4,47 @@ import pandas as pd
 import math
 from typing import Dict
 
+try:
+    import pyarrow  # noqa: F401  (apenas para escolher o motor de leitura CSV)
+    CSV_ENGINE = "pyarrow"
+except ImportError:
+    CSV_ENGINE = "c"
+
 PREFIX_METRO = "METRO"
 PREFIX_STCP = "STCP"
 
+# Tipos explícitos para as colunas de identificadores/horas: evita a inferência
+# de tipos em dois passos e garante IDs como texto (ex.: "5697", "0TRD6").
+GTFS_DTYPES: Dict[str, Dict[str, str]] = {
+    "stops.txt": {"stop_id": "str", "stop_name": "str", "zone_id": "str"},
+    "stop_times.txt": {
+        "trip_id": "str",
+        "arrival_time": "str",
+        "departure_time": "str",
+        "stop_id": "str",
+    },
+    "trips.txt": {"trip_id": "str", "route_id": "str"},
+    "transfers.txt": {"from_stop_id": "str", "to_stop_id": "str"},
+    "frequencies.txt": {"trip_id": "str"},
+    "fare_attributes.txt": {"fare_id": "str"},
+    "fare_rules.txt": {
+        "fare_id": "str",
+        "route_id": "str",
+        "origin_id": "str",
+        "destination_id": "str",
+        "contains_id": "str",
+    },
+}
+
 # local do root do projeto (assume estrutura project/src)
 PROJECT_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
 
+# diretórios de outputs (cache do grafo e frentes Pareto do `main.py`)
+OUTPUTS_DIR = os.path.join(PROJECT_ROOT, "outputs")
+CACHE_DIR = os.path.join(OUTPUTS_DIR, "cache")
+PARETO_DIR = os.path.join(OUTPUTS_DIR, "pareto")
+GRAPH_CACHE_FILE = os.path.join(CACHE_DIR, "graph_cache.pkl")
+
 # caminho por omissão para regras de pontes
 DEFAULT_BRIDGES_RULES_PATH = os.path.join(
     PROJECT_ROOT, "data", "bridges", "bridges_pedestrian_rules.txt"
@@ -30,17 +65,16 @@ def load_bridge_rules(path: str | None = None) -> Dict[str, bool]:
     - Esperam-se exatamente 4 colunas separadas por ';'.
     - `walk_allowed` deve ser '1' (True) ou '0' (False).
 
-    Devolve um dicionário {bridge_id: walk_allowed}.
+    Devolve um dicionário {bridge_id: walk_allowed}. A cache `BRIDGE_RULES` é
+    atualizada no próprio dicionário, para que quem a importou veja as regras.
     """
-    global BRIDGE_RULES
-
     rules: Dict[str, bool] = {}
 
     if path is None:
         path = DEFAULT_BRIDGES_RULES_PATH
 
     if not path or not os.path.exists(path):
-        BRIDGE_RULES = rules
+        BRIDGE_RULES.clear()
         return rules
 
     try:
@@ -63,7 +97,8 @@ def load_bridge_rules(path: str | None = None) -> Dict[str, bool]:
         # Se houver erro de IO, mantém regras vazias
         rules = {}
 
-    BRIDGE_RULES = rules
+    BRIDGE_RULES.clear()
+    BRIDGE_RULES.update(rules)
     return rules
 
 def _candidate_paths(folder: str, filename: str):
@@ -84,12 +119,34 @@ def find_file(folder: str, filename: str):
     """
     if folder is None:
         return None
+    seen = set()
     for p in _candidate_paths(folder, filename):
         p_norm = os.path.normpath(p)
-        if os.path.exists(p_norm):
+        if p_norm in seen:
+            continue
+        seen.add(p_norm)
+        # isfile faz um único stat e ignora diretórios com o mesmo nome
+        if os.path.isfile(p_norm):
             return p_norm
     return None
 
+# Colunas efetivamente usadas na construção do grafo; as restantes (ex.:
+# `stop_headsign`, `pickup_type`, `shape_dist_traveled`) não chegam a ser lidas.
+GTFS_USECOLS: Dict[str, frozenset] = {
+    "stop_times.txt": frozenset(
+        {"trip_id", "arrival_time", "departure_time", "stop_id", "stop_sequence"}
+    ),
+}
+
+
+def _usecols_for(path: str, filename: str):
+    wanted = GTFS_USECOLS.get(filename)
+    if wanted is None:
+        return None
+    header = pd.read_csv(path, nrows=0).columns
+    return [c for c in header if c in wanted]
+
+
 def _load_csv_if_exists(folder: str, filename: str, required=False, required_cols=None):
     path = find_file(folder, filename)
     if path is None:
@@ -102,7 +159,12 @@ def _load_csv_if_exists(folder: str, filename: str, required=False, required_col
             )
         return None, None
     try:
-        df = pd.read_csv(path)
+        df = pd.read_csv(
+            path,
+            engine=CSV_ENGINE,
+            dtype=GTFS_DTYPES.get(filename),
+            usecols=_usecols_for(path, filename),
+        )
     except Exception as e:
         raise RuntimeError(f"Failed to read {path}: {e}")
     if required_cols:
@@ -112,6 +174,8 @@ def _load_csv_if_exists(folder: str, filename: str, required=False, required_col
                 raise ValueError(f"{filename} missing required columns: {missing} (file: {path})")
             for col in missing:
                 df[col] = pd.NA
+    if filename == "stop_times.txt" and "stop_sequence" in df.columns:
+        df["stop_sequence"] = pd.to_numeric(df["stop_sequence"], downcast="integer")
     if filename == "fare_attributes.txt" and "price" in df.columns:
         try:
             df["price"] = pd.to_numeric(df["price"], errors="raise").astype(float)
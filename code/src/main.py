@@ -2,17 +2,19 @@ import argparse
 import os
 import pickle
 from typing import Optional
-from loader import load_system, PREFIX_METRO, PREFIX_STCP, PROJECT_ROOT
+from loader import (
+    CACHE_DIR,
+    GRAPH_CACHE_FILE,
+    PARETO_DIR,
+    PREFIX_METRO,
+    PREFIX_STCP,
+    load_system,
+)
 from graph_builder import MultimodalGraph, add_direct_walk_edge
 from constants import PENALTY
 from evolution import run_nsga2
 from deap import tools
 
-OUTPUTS_DIR = os.path.join(PROJECT_ROOT, "outputs")
-CACHE_DIR = os.path.join(OUTPUTS_DIR, "cache")
-PARETO_DIR = os.path.join(OUTPUTS_DIR, "pareto")
-GRAPH_CACHE_FILE = os.path.join(CACHE_DIR, "graph_cache.pkl")
-
 
 def _parse_point(value):
     if value is None:
@@ -38,7 +40,7 @@ def _parse_point(value):
 def run_example(origin=None, dest=None, origin_name=None, dest_name=None,
                 metro_folder=None, stcp_folder=None,
                 walk_radius=400, pop_size=50, generations=30,
-                wmax_s=None, tmax=None, walk_policy=None, include_cost=False):
+                wmax_s=None, tmax=None, walk_policy=None, include_cost=False, workers=1):
 
     def candidate_ids(stop_id):
         s = str(stop_id)
@@ -67,7 +69,7 @@ def run_example(origin=None, dest=None, origin_name=None, dest_name=None,
         print("Building multimodal graph...")
         G = MultimodalGraph(data, walk_radius_m=walk_radius)
         with open(GRAPH_CACHE_FILE, "wb") as f:
-            pickle.dump(G, f)
+            pickle.dump(G, f, protocol=pickle.HIGHEST_PROTOCOL)
         print("Graph cached to", GRAPH_CACHE_FILE)
 
     # obter conjunto de nós do grafo (suporta wrapper com atributo G)
@@ -168,6 +170,7 @@ def run_example(origin=None, dest=None, origin_name=None, dest_name=None,
         w_max=wmax_s,
         t_max=tmax,
         include_cost=include_cost,
+        workers=workers,
     )
     print("NSGA-II finished.")
 
@@ -250,6 +253,8 @@ if __name__ == "__main__":
                         help="Política para o objetivo de caminhada (maximize por omissão).")
     parser.add_argument("--include-cost", action="store_true",
                         help="Adicionar custo como quarto objetivo na otimização.")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="Número de processos para avaliar o fitness em paralelo (1 = sequencial).")
     args = parser.parse_args()
 
     if not args.origin and not args.origin_name:
@@ -268,4 +273,5 @@ if __name__ == "__main__":
                 wmax_s=args.wmax_s,
                 tmax=args.tmax,
                 walk_policy=args.walk_policy,
-                include_cost=args.include_cost)
+                include_cost=args.include_cost,
+                workers=args.workers)